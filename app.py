@@ -1,174 +1,93 @@
 
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, g, stream_with_context
 from flask_cors import CORS
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
+import json
 import os
-from groq_api import extract_with_groq
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 import re
+import threading
+import time
+import uuid
+from groq_api import usage_meter
+from extraction_backends import make_extraction_backend
+from forecasting import DemandForecaster
+from formulary import canonical_medicine_name
+from patients import PatientIndex
+from extraction import (
+    SHEET_HEADERS, parse_duration, local_extract, apply_groq_response, fill_total_tablets,
+    extract_prescriptions, missing_fields, format_duration, format_timing, medicine_note, prescription_to_row
+)
+from response_cache import ResponseCache
+from rollups import BUCKETS, Rollups, period_count
+from session_store import make_session_store
+from sheets import SheetConnection
+from stats import PrescriptionStats
+from storage import SQLiteStore
+from suggestions import MedicineSuggester
+from write_queue import EXPORT_ID_HEADER, WriteBehindQueue
 
 load_dotenv()
 
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-creds = ServiceAccountCredentials.from_json_keyfile_name("creds.json", scope)
-client = gspread.authorize(creds)
+SHEET_ID = os.getenv("GOOGLE_SHEET_ID", "1wirb9ZLhLYZW45-1HtRxl3yiL0382zYUh9pv7lE8X1g")
 
-SHEET_ID = "1wirb9ZLhLYZW45-1HtRxl3yiL0382zYUh9pv7lE8X1g"
-
-sheet = client.open_by_key(SHEET_ID).sheet1
+# Connects on first use so workers boot (and serve the chat) without Sheets.
+# The extra last column holds each exported row's write-queue id.
+sheet_conn = SheetConnection("creds.json", SHEET_ID, SHEET_HEADERS + [EXPORT_ID_HEADER])
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "your_secret_key_change_this_in_production")
 CORS(app)
 
-def parse_duration(duration_str):
-    """Parse duration string and return normalized format"""
-    duration_str = duration_str.strip().lower()
-    
-    # Extract number and unit
-    duration_match = re.search(r'(\d+)\s*(day|days|week|weeks|month|months|d|w|m)', duration_str)
-    if duration_match:
-        number = int(duration_match.group(1))
-        unit = duration_match.group(2)
-        
-        # Normalize unit
-        if unit in ['day', 'days', 'd']:
-            return number, 'days'
-        elif unit in ['week', 'weeks', 'w']:
-            return number, 'weeks'
-        elif unit in ['month', 'months', 'm']:
-            return number, 'months'
-    
-    return None, None
-
-def parse_food_timing(prescription_text):
-    """FIXED: Parse food timing from prescription text - handles 'before' correctly"""
-    text = prescription_text.lower()
-    
-    # Check for before food indicators - FIXED ORDER
-    before_food_patterns = [
-        r'before\s+food',
-        r'before\s+meal',
-        r'before\s+eating',
-        r'empty\s+stomach',
-        r'on\s+empty\s+stomach'
-    ]
-    
-    # Check for after food indicators
-    after_food_patterns = [
-        r'after\s+food',
-        r'after\s+meal',
-        r'after\s+eating',
-        r'with\s+food',
-        r'with\s+meal'
-    ]
-    
-    # FIXED: Check before food patterns FIRST
-    for pattern in before_food_patterns:
-        if re.search(pattern, text):
-            return "before food"
-    
-    for pattern in after_food_patterns:
-        if re.search(pattern, text):
-            return "after food"
-    
-    return None
+# Conversation state lives server-side; the cookie only carries a session id
+session_store = make_session_store()
 
-def parse_frequency(freq_str):
-    """Parse frequency and timing from prescription text"""
-    freq_str = freq_str.strip().lower()
+# Model that refines low-confidence parses: GROQ, a local server or rules only
+extraction_backend = make_extraction_backend()
 
-    timings = {
-        'morning': False,
-        'afternoon': False,
-        'night': False
-    }
+def session_id():
+    if 'sid' not in session:
+        session['sid'] = uuid.uuid4().hex
+    return session['sid']
 
-    # Look for keywords that suggest timing
-    if any(word in freq_str for word in ['morning', 'morn', 'am', 'breakfast']):
-        timings['morning'] = True
-    if any(word in freq_str for word in ['afternoon', 'lunch', 'noon', 'pm']):
-        timings['afternoon'] = True
-    if any(word in freq_str for word in ['night', 'evening', 'dinner', 'bedtime', 'sleep']):
-        timings['night'] = True
-
-    # Improved regex to catch more patterns
-    frequency_patterns = [
-        r'for\s+(\d+)\s*times?\s*(?:a\s*)?day',
-        r'(\d+)\s*times?\s*(?:a\s*)?day',
-        r'(\d+)\s*times?\s*daily',
-        r'(\d+)[x×]\s*day',
-        r'(\d+)\s*/\s*day'
-    ]
-
-    times_per_day = 1  # Default fallback
-    for pattern in frequency_patterns:
-        match = re.search(pattern, freq_str)
-        if match:
-            times_per_day = int(match.group(1))
-            break
-
-    # If timing not explicitly mentioned, infer from times_per_day
-    if not any(timings.values()) and times_per_day > 0:
-        if times_per_day == 1:
-            timings['morning'] = True
-        elif times_per_day == 2:
-            timings['morning'] = True
-            timings['night'] = True
-        elif times_per_day == 3:
-            timings['morning'] = True
-            timings['afternoon'] = True
-            timings['night'] = True
-
-    return timings, times_per_day, "complete" if any(timings.values()) else "timing_needed"
-
-def calculate_total_tablets(duration_num, duration_unit, timings, times_per_day):
-    """Calculate total tablet count based on accurate times per day"""
-    try:
-        # Convert duration to days
-        if duration_unit == 'days':
-            total_days = duration_num
-        elif duration_unit == 'weeks':
-            total_days = duration_num * 7
-        elif duration_unit == 'months':
-            total_days = duration_num * 30  # Approximate
-        else:
-            total_days = duration_num  # fallback
+def conversation_state():
+    """This session's server-side state, loaded once per request"""
+    if 'conversation' not in g:
+        g.conversation = session_store.get(session_id())
+    return g.conversation
 
-        # Use times_per_day directly as the actual frequency
-        total_tablets = total_days * times_per_day
-        return total_tablets
+# A visit's medications form a cart: every confirmed card stays in
+# state['cart'] and state['active'] points at the one being edited
 
-    except Exception as e:
-        print(f"Error calculating total tablets: {str(e)}")
-        return 0
-
-def extract_medicine_name(prescription_text):
-    """Extract medicine name from prescription text - IMPROVED VERSION"""
-    text = prescription_text.lower()
-    
-    # Remove common prefixes and clean text
-    text = re.sub(r'^(take\s+(the\s+)?|have\s+)', '', text)
-    
-    # Look for medicine name patterns
-    medicine_patterns = [
-        r'^([a-zA-Z][a-zA-Z\s]*?)\s+(?:\d+|tablet|twice|once|morning|afternoon|night|before|after|for)',
-        r'^([a-zA-Z][a-zA-Z\s]*?)\s+(?:\d+\s*times)',
-        r'^([a-zA-Z][a-zA-Z\s]*?)\s+(?:for\s+\d+)',
-        r'^([a-zA-Z][a-zA-Z\s]*?)(?:\s+\d+|\s+tablet|\s+twice|\s+once)'
-    ]
-    
-    for pattern in medicine_patterns:
-        match = re.search(pattern, text)
-        if match:
-            medicine_name = match.group(1).strip()
-            # Filter out common words that aren't medicine names
-            if medicine_name not in ['the', 'for', 'take', 'tablet', 'tablets', 'times', 'day', 'days', 'in', 'and', 'or', 'have']:
-                return medicine_name.title()
-    
-    return "Not specified"
+def get_cart():
+    return conversation_state().get('cart', [])
+
+def get_pending():
+    state = conversation_state()
+    active = state.get('active')
+    return state['cart'][active] if active is not None else None
+
+def set_pending(prescription):
+    state = conversation_state()
+    cart = state.setdefault('cart', [])
+    if state.get('active') is None:
+        cart.append(prescription)
+        state['active'] = len(cart) - 1
+    else:
+        cart[state['active']] = prescription
+    session_store.set(session_id(), state)
+
+def set_active(index):
+    """Make cart item `index` the one being edited (None to start a new one)"""
+    state = conversation_state()
+    state['active'] = index
+    session_store.set(session_id(), state)
+
+def clear_cart():
+    state = conversation_state()
+    if state.pop('cart', None) is not None:
+        state.pop('active', None)
+        session_store.set(session_id(), state)
 
 @app.route('/')
 def index():
@@ -176,12 +95,22 @@ def index():
 
 @app.route('/start_chat', methods=['POST'])
 def start_chat():
+    if 'sid' in session:
+        session_store.delete(session['sid'])
     session.clear()
     patient_name = request.json.get('name')
     session['patient_name'] = patient_name
     
     welcome_msg = f"Hello Doctor! Please enter the patient prescription details (e.g., 'take paracetamol 2 times a day for 3 days before food')."
     
+    recent = recent_prescriptions(patient_name, limit=5)
+    if recent:
+        lines = "".join(
+            f"{record['Date']}: {record['Medicine Name']} - {record['Duration']}, {record['Timing']}<br>"
+            for record in recent
+        )
+        welcome_msg += f"<br><br><b>Recent prescriptions for {patient_name}:</b><br>{lines}"
+    
     return jsonify({"message": welcome_msg})
 
 @app.route('/message', methods=['POST'])
@@ -190,13 +119,104 @@ def message():
     patient_name = request.json.get('name')
     today = datetime.now().strftime("%Y-%m-%d")
     
+    response = handle_conversation_command(user_msg, patient_name, today)
+    if response is not None:
+        return response
+    
+    # Process initial prescription message: rule-based parsers first, and the
+    # LLM only when they could not resolve every field unambiguously
+    prescription, timing_status, confident = local_extract(user_msg)
+    if not confident:
+        refine_with_llm(prescription, user_msg)
+    
+    return finish_prescription(prescription, timing_status, patient_name, today)
+
+@app.route('/message/stream', methods=['POST'])
+def message_stream():
+    """
+    Streaming variant of /message (Server-Sent Events).
+
+    Emits `local` with the rule-based parse immediately, `refined` once the
+    GROQ result has been merged (only when the LLM is consulted), and `final`
+    with the same payload /message would have returned. Commands and edits
+    ("yes", "Duration: 5 days", ...) produce a single `final` event.
+    """
+    user_msg = request.json.get('message')
+    patient_name = request.json.get('name')
+    today = datetime.now().strftime("%Y-%m-%d")
+    
+    # The session id must be in the cookie before the body starts streaming
+    session_id()
+    
+    def generate():
+        response = handle_conversation_command(user_msg, patient_name, today)
+        if response is not None:
+            yield sse_event('final', response.get_json())
+            return
+        
+        prescription, timing_status, confident = local_extract(user_msg)
+        yield sse_event('local', {
+            "message": format_preview(prescription, "Reading prescription..." if not confident else ""),
+            "prescription": prescription,
+            "confident": confident
+        })
+        
+        if not confident:
+            refine_with_llm(prescription, user_msg)
+            yield sse_event('refined', {
+                "message": format_preview(prescription),
+                "prescription": prescription
+            })
+        
+        yield sse_event('final', finish_prescription(prescription, timing_status, patient_name, today).get_json())
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def format_preview(prescription, note=""):
+    """Short provisional summary shown while extraction is still running"""
+    timing_str = format_timing(prescription)
+    return (
+        f"Medicine: {prescription['Medicine Name']}<br>"
+        f"Duration: {prescription['Duration']} {prescription['Duration Unit']}<br>"
+        f"Timing: {timing_str or 'Not specified'}<br>"
+        f"Food Timing: {prescription['Food Timing']}<br>"
+        + (f"<i>{note}</i>" if note else "")
+    )
+
+def refine_with_llm(prescription, user_msg):
+    """Merge the model's extraction into a locally parsed prescription"""
+    try:
+        groq_response = extraction_backend.extract(user_msg)
+    except Exception as e:
+        print(f"Extraction backend error: {str(e)}")
+        groq_response = None
+    apply_groq_response(prescription, groq_response)
+
+def handle_conversation_command(user_msg, patient_name, today):
+    """
+    Handle confirmations, cart commands, quick buttons and field edits.
+    Returns None when the message is a new prescription to extract.
+    """
     # Check if user is confirming or editing
-    if user_msg.lower().strip() in ['yes', 'y', 'correct', 'ok', 'confirm']:
-        if 'pending_prescription' in session:
-            return save_prescription(session['pending_prescription'], patient_name, today)
+    if user_msg.lower().strip() in ['yes', 'y', 'correct', 'ok', 'confirm', 'save all']:
+        if get_cart():
+            return save_prescriptions(get_cart(), patient_name, today)
         else:
             return jsonify({"message": "No pending prescription to save. Please start over."})
     
+    if user_msg.lower().strip() in ['add another', 'add', 'next']:
+        return handle_add_another()
+    
+    edit_match = re.match(r'^\s*(?:edit|item)\s+#?(\d+)\s*$', user_msg.lower())
+    if edit_match:
+        return handle_edit_item(int(edit_match.group(1)), patient_name, today)
+    
     if user_msg.lower().strip() in ['no', 'n', 'incorrect', 'edit']:
         return jsonify({
             "message": "What would you like to change? Please specify the field and new value (e.g., 'Duration: 5 days' or 'Timing: morning and night')",
@@ -214,7 +234,7 @@ def message():
         return handle_quick_button_response(user_msg, patient_name, today)
     
     # Handle field edits
-    if 'pending_prescription' in session:
+    if get_pending() is not None:
         if ':' in user_msg:
             return handle_field_edit(user_msg, patient_name, today)
         elif 'morning' in user_msg.lower() or 'afternoon' in user_msg.lower() or 'night' in user_msg.lower():
@@ -222,102 +242,17 @@ def message():
         elif 'before food' in user_msg.lower() or 'after food' in user_msg.lower():
             return handle_food_timing_update(user_msg, patient_name, today)
     
-    # Process initial prescription message
-    try:
-        groq_response = extract_with_groq(user_msg)
-        if groq_response is None:
-            groq_response = ""
-    except Exception as e:
-        print(f"GROQ API error: {str(e)}")
-        groq_response = ""
-    
-    # Initialize prescription fields
-    prescription = {
-        "Medicine Name": extract_medicine_name(user_msg),
-        "Duration": "-",
-        "Duration Unit": "-",
-        "Morning": "no",
-        "Afternoon": "no", 
-        "Night": "no",
-        "Times Per Day": 1,
-        "Food Timing": "-",
-        "Total Tablets": 0,
-        "Raw Prescription": user_msg
-    }
-    
-    # Parse duration
-    duration_num, duration_unit = parse_duration(user_msg)
-    if duration_num and duration_unit:
-        prescription["Duration"] = str(duration_num)
-        prescription["Duration Unit"] = duration_unit
-    
-    # Parse frequency and timing - FIXED
-    timings, times_per_day, timing_status = parse_frequency(user_msg)
-    prescription["Morning"] = "yes" if timings['morning'] else "no"
-    prescription["Afternoon"] = "yes" if timings['afternoon'] else "no"
-    prescription["Night"] = "yes" if timings['night'] else "no"
-    prescription["Times Per Day"] = times_per_day
-    
-    # Parse food timing - FIXED
-    food_timing = parse_food_timing(user_msg)
-    if food_timing:
-        prescription["Food Timing"] = food_timing
-    
-    # Process GROQ response if available
-    if groq_response and groq_response.strip():
-        for line in groq_response.strip().split("\n"):
-            if ":" not in line:
-                continue
-            try:
-                key, value = line.split(":", 1)
-                key = key.strip().lower()
-                value = value.strip()
-                
-                if key == "medicine name":
-                    prescription["Medicine Name"] = value
-                elif key == "duration":
-                    prescription["Duration"] = value
-                elif key == "duration unit":
-                    prescription["Duration Unit"] = value
-                elif key == "morning":
-                    prescription["Morning"] = value.lower()
-                elif key == "afternoon":
-                    prescription["Afternoon"] = value.lower()
-                elif key == "night":
-                    prescription["Night"] = value.lower()
-                elif key == "times per day":
-                    try:
-                        prescription["Times Per Day"] = int(value)
-                    except:
-                        pass
-                elif key == "food timing":
-                    prescription["Food Timing"] = value
-            except ValueError:
-                continue
-    
+    return None
+
+def finish_prescription(prescription, timing_status, patient_name, today):
+    """Ask for missing fields, or store the prescription and show the confirmation card"""
     # Check for missing required information
-    missing = []
-    if prescription["Medicine Name"] == "Not specified":
-        missing.append("Medicine Name")
-    if prescription["Duration"] == "-":
-        missing.append("Duration (e.g., '3 days', '2 weeks')")
-    
-    # Check if timing is needed
-    if timing_status == "timing_needed":
-        missing.append("Timing (morning/afternoon/night)")
-    
-    # Check if food timing is needed
-    if prescription["Food Timing"] == "-":
-        missing.append("Food Timing (before food/after food)")
+    missing = missing_fields(prescription, timing_status)
     
     if missing:
         buttons = []
         if "Medicine Name" in missing:
-            buttons.extend([
-                {"text": "Paracetamol", "value": "Medicine: Paracetamol"},
-                {"text": "Dolo", "value": "Medicine: Dolo"},
-                {"text": "Aspirin", "value": "Medicine: Aspirin"}
-            ])
+            buttons.extend(medicine_quick_buttons(3))
         if "Timing (morning/afternoon/night)" in missing:
             buttons.extend([
                 {"text": "Morning", "value": "morning"},
@@ -339,39 +274,20 @@ def message():
             "quick_buttons": buttons
         })
     
-    # Calculate total tablets - FIXED
-    if prescription["Duration"] != "-" and prescription["Duration Unit"] != "-":
-        try:
-            duration_num = int(prescription["Duration"])
-            timings_dict = {
-                'morning': prescription["Morning"] == "yes",
-                'afternoon': prescription["Afternoon"] == "yes",
-                'night': prescription["Night"] == "yes"
-            }
-            prescription["Total Tablets"] = calculate_total_tablets(
-                duration_num, prescription["Duration Unit"], timings_dict, prescription["Times Per Day"]
-            )
-        except:
-            prescription["Total Tablets"] = 0
-    
     # Store prescription for confirmation
-    session['pending_prescription'] = prescription
+    set_pending(prescription)
     
     # Show confirmation
     return show_prescription_confirmation(prescription, patient_name, today)
 
+
 def handle_quick_button_response(button_type, patient_name, today):
     """Handle responses from quick buttons"""
     if button_type == "medicine":
         return jsonify({
             "message": "Please enter the medicine name:",
             "show_quick_buttons": True,
-            "quick_buttons": [
-                {"text": "Paracetamol", "value": "Medicine: Paracetamol"},
-                {"text": "Dolo", "value": "Medicine: Dolo"},
-                {"text": "Aspirin", "value": "Medicine: Aspirin"},
-                {"text": "Crocin", "value": "Medicine: Crocin"}
-            ]
+            "quick_buttons": medicine_quick_buttons(4)
         })
     elif button_type == "duration":
         return jsonify({
@@ -408,25 +324,25 @@ def handle_quick_button_response(button_type, patient_name, today):
 
 def handle_food_timing_update(user_msg, patient_name, today):
     """Handle food timing updates"""
-    if 'pending_prescription' not in session:
+    if get_pending() is None:
         return jsonify({"message": "No pending prescription to edit. Please start over."})
     
-    prescription = session['pending_prescription']
+    prescription = get_pending()
     
     if 'before food' in user_msg.lower():
         prescription["Food Timing"] = "before food"
     elif 'after food' in user_msg.lower():
         prescription["Food Timing"] = "after food"
     
-    session['pending_prescription'] = prescription
+    set_pending(prescription)
     return show_prescription_confirmation(prescription, patient_name, today, "Updated food timing")
 
 def handle_timing_update(user_msg, patient_name, today):
     """Handle timing updates specifically"""
-    if 'pending_prescription' not in session:
+    if get_pending() is None:
         return jsonify({"message": "No pending prescription to edit. Please start over."})
     
-    prescription = session['pending_prescription']
+    prescription = get_pending()
     
     # Reset timings
     prescription["Morning"] = "no"
@@ -447,30 +363,18 @@ def handle_timing_update(user_msg, patient_name, today):
     prescription["Times Per Day"] = timing_count or 1
     
     # Recalculate total tablets
-    if prescription["Duration"] != "-":
-        try:
-            duration_num = int(prescription["Duration"])
-            timings_dict = {
-                'morning': prescription["Morning"] == "yes",
-                'afternoon': prescription["Afternoon"] == "yes",
-                'night': prescription["Night"] == "yes"
-            }
-            prescription["Total Tablets"] = calculate_total_tablets(
-                duration_num, prescription["Duration Unit"], timings_dict, prescription["Times Per Day"]
-            )
-        except:
-            prescription["Total Tablets"] = 0
+    fill_total_tablets(prescription)
     
-    session['pending_prescription'] = prescription
+    set_pending(prescription)
     
     return show_prescription_confirmation(prescription, patient_name, today, "Updated timing")
 
 def handle_field_edit(user_msg, patient_name, today):
     """Handle editing of specific prescription fields"""
-    if 'pending_prescription' not in session:
+    if get_pending() is None:
         return jsonify({"message": "No pending prescription to edit. Please start over."})
     
-    prescription = session['pending_prescription']
+    prescription = get_pending()
     updated_fields = []
     
     field_updates = [update.strip() for update in user_msg.split(',')]
@@ -510,6 +414,9 @@ def handle_field_edit(user_msg, patient_name, today):
                             prescription["Duration"] = str(duration_num)
                             prescription["Duration Unit"] = duration_unit
                             updated_fields.append("Duration")
+                    elif actual_field == 'Medicine Name':
+                        prescription["Medicine Name"] = canonical_medicine_name(new_value)
+                        updated_fields.append(actual_field)
                     else:
                         prescription[actual_field] = new_value
                         updated_fields.append(actual_field)
@@ -517,33 +424,15 @@ def handle_field_edit(user_msg, patient_name, today):
                 continue
     
     # Recalculate total tablets
-    if prescription["Duration"] != "-":
-        try:
-            duration_num = int(prescription["Duration"])
-            timings_dict = {
-                'morning': prescription["Morning"] == "yes",
-                'afternoon': prescription["Afternoon"] == "yes",
-                'night': prescription["Night"] == "yes"
-            }
-            prescription["Total Tablets"] = calculate_total_tablets(
-                duration_num, prescription["Duration Unit"], timings_dict, prescription["Times Per Day"]
-            )
-        except:
-            prescription["Total Tablets"] = 0
+    fill_total_tablets(prescription)
     
-    session['pending_prescription'] = prescription
+    set_pending(prescription)
     
     if updated_fields:
         return show_prescription_confirmation(prescription, patient_name, today, f"Updated: {', '.join(updated_fields)}")
     else:
         return jsonify({"message": "I couldn't understand what you want to change. Please use format 'Field: New Value'"})
 
-def format_duration(num, unit):
-    """Formats duration with correct singular/plural"""
-    if str(num) == "1" and unit.endswith('s'):
-        unit = unit[:-1]
-    return f"{num} {unit}"
-
 def show_prescription_confirmation(prescription, patient_name, today, extra_msg=""):
     """Show prescription confirmation message"""
     timing_str = []
@@ -558,92 +447,188 @@ def show_prescription_confirmation(prescription, patient_name, today, extra_msg=
         <b>Please review your prescription:</b><br>
         Patient: {patient_name}<br>
         Date: {today}<br>
-        Medicine: {prescription['Medicine Name']}<br>
+        Medicine: {prescription['Medicine Name']}{medicine_note(prescription['Medicine Name'])}<br>
         Duration: {format_duration(prescription['Duration'], prescription['Duration Unit'])}<br>
         Timing: {', '.join(timing_str) if timing_str else 'Not specified'}<br>
         Food Timing: {prescription['Food Timing']}<br>
         Times per day: {prescription['Times Per Day']}<br>
         Total tablets needed: {prescription['Total Tablets']}<br>
         {f"<br><i>{extra_msg}</i>" if extra_msg else ""}
+        {format_cart_summary(get_cart(), conversation_state().get('active'))}
         <br><b>Is everything correct?</b><br>
     """
     
+    cart_size = len(get_cart())
     return jsonify({
         "message": formatted,
         "show_quick_buttons": True,
         "quick_buttons": [
-            {"text": "Yes, Save", "value": "yes"},
+            {"text": f"Yes, Save All ({cart_size})" if cart_size > 1 else "Yes, Save", "value": "yes"},
+            {"text": "Add Another Medicine", "value": "add another"},
             {"text": "No, Edit", "value": "no"}
         ]
     })
 
-def save_prescription(prescription, patient_name, today):
-    """FIXED: Save confirmed prescription to Google Sheets with better error handling"""
-    try:
-        # Test sheet connection first
-        print("Testing Google Sheets connection...")
-        test_data = sheet.get_all_values()
-        print(f"Successfully connected to sheet. Current rows: {len(test_data)}")
-        
-        # Ensure sheet headers exist
+def format_cart_summary(cart, active=None):
+    """List the other medications already added in this visit"""
+    others = [(i, item) for i, item in enumerate(cart) if i != active]
+    if not others:
+        return ""
+    lines = "".join(
+        f"{i + 1}. {item['Medicine Name']} - {format_duration(item['Duration'], item['Duration Unit'])}, "
+        f"{item['Times Per Day']}x/day (say 'edit {i + 1}' to change)<br>"
+        for i, item in others
+    )
+    return f"<br><b>Also in this visit:</b><br>{lines}"
+
+def handle_add_another():
+    """Keep the current medication in the cart and start a new one"""
+    cart = get_cart()
+    if not cart:
+        return jsonify({"message": "No pending prescription yet. Please enter the first medicine."})
+    
+    set_active(None)
+    names = ", ".join(item["Medicine Name"] for item in cart)
+    return jsonify({
+        "message": f"Added to this visit ({len(cart)}): {names}.<br>Please enter the next medicine, or save them all.",
+        "show_quick_buttons": True,
+        "quick_buttons": [
+            {"text": f"Save All ({len(cart)})", "value": "yes"}
+        ]
+    })
+
+def handle_edit_item(number, patient_name, today):
+    """Switch editing to another medication already in the cart"""
+    cart = get_cart()
+    if not 1 <= number <= len(cart):
+        return jsonify({"message": f"There is no item {number}. This visit has {len(cart)} medicine(s)."})
+    
+    set_active(number - 1)
+    return show_prescription_confirmation(cart[number - 1], patient_name, today, f"Editing item {number}")
+
+def flush_rows_to_sheet(rows):
+    """Export a batch of saved rows with a single append_rows call"""
+    sheet_conn.run(lambda sheet: sheet.append_rows(rows, value_input_option='RAW'))
+
+def sheet_rows_from(start_row):
+    """Return every row from `start_row` to the end of the sheet in one range read"""
+    return sheet_conn.run(lambda sheet: sheet.get(f'A{start_row}:{sheet_conn.last_range}'))
+
+def sheet_tail(count):
+    """Return the last `count` data rows of the sheet without downloading all of it"""
+    def read_tail(sheet):
+        last_row = len(sheet.col_values(1))
+        if last_row <= 1:
+            return []
+        first_row = max(2, last_row - count + 1)
+        return sheet.get(f'A{first_row}:{sheet_conn.last_range}{last_row}')
+    return sheet_conn.run(read_tail)
+
+# Local SQLite is the system of record; Google Sheets is an export of it
+store = SQLiteStore(os.getenv("STORE_PATH", "prescriptions.sqlite3"), SHEET_HEADERS)
+
+# Dashboard counters are folded in as the store sees new rows
+prescription_stats = PrescriptionStats(normalize=canonical_medicine_name)
+store.add_listener(prescription_stats.add_records)
+
+# Type-ahead and quick buttons ranked by what this clinic prescribes
+medicine_suggester = MedicineSuggester()
+store.add_listener(medicine_suggester.add_records)
+
+# Each patient's prescription row ids, for history lookups without a scan
+patient_index = PatientIndex()
+store.add_listener(patient_index.add_records)
+
+# Every prescription reduced to integers for the pharmacy demand forecast
+demand_forecaster = DemandForecaster(normalize=canonical_medicine_name)
+store.add_listener(demand_forecaster.add_records)
+
+# Per-day / per-week counts for the trend charts, updated in each save's
+# transaction; built from history the first time a store runs without them
+rollups = Rollups(store, normalize=canonical_medicine_name)
+rollups.rebuild(only_if_empty=True)
+
+def admin_cache_state():
+    """Newest stored row id, or None while this worker's aggregates are still catching up"""
+    version = store.data_version()
+    return version if store.seen_row >= version else None
+
+# Admin responses are reused until a save or a newly synced row changes the data
+admin_cache = ResponseCache(ttl=int(os.getenv("ADMIN_CACHE_TTL", "60")), state_fn=admin_cache_state)
+store.add_listener(admin_cache.bump)
+
+# Feed the stored history to the listeners off the request path
+store.warm()
+
+write_queue = WriteBehindQueue(
+    os.getenv("WRITE_QUEUE_PATH", "prescription_queue.journal"),
+    flush_fn=flush_rows_to_sheet,
+    tail_fn=sheet_tail,
+    batch_size=int(os.getenv("WRITE_QUEUE_BATCH_SIZE", "20")),
+    flush_interval=float(os.getenv("WRITE_QUEUE_FLUSH_INTERVAL", "2.0"))
+)
+
+# SHEET_EXPORT=0 runs fully offline: nothing is queued for or read from Sheets
+SHEET_EXPORT = os.getenv("SHEET_EXPORT", "1") == "1"
+
+# Sheet rows exported from a store carry their write-queue id in this column
+EXPORT_ID_COLUMN = len(SHEET_HEADERS)
+
+def import_sheet_history(retry_interval=5, max_retry_interval=300):
+    """
+    Copy the sheet's history (rows not exported from a store) into the store
+    once. Retried with backoff until it succeeds, since Sheets may be down at
+    first boot; the store records completion, so saves made in the meantime
+    never stop the history from arriving.
+    """
+    while not store.history_imported():
         try:
-            headers = sheet.row_values(1)
-            if not headers or len(headers) < 5:
-                # Create headers if sheet is empty or incomplete
-                headers = [
-                    "Patient Name", "Date", "Medicine Name", "Duration", 
-                    "Duration Unit", "Timing", "Food Timing", "Times Per Day", 
-                    "Total Tablets", "Raw Prescription"
-                ]
-                if not sheet.row_values(1):
-                    sheet.append_row(headers)
-                else:
-                    sheet.update('A1:J1', [headers])
-                print("Headers created/updated successfully")
-        except Exception as e:
-            print(f"Error handling headers: {str(e)}")
-            # Force create headers
-            headers = [
-                "Patient Name", "Date", "Medicine Name", "Duration", 
-                "Duration Unit", "Timing", "Food Timing", "Times Per Day", 
-                "Total Tablets", "Raw Prescription"
+            rows = sheet_rows_from(2)
+            history = [
+                (row_number, row) for row_number, row in enumerate(rows, 2)
+                if len(row) <= EXPORT_ID_COLUMN or not row[EXPORT_ID_COLUMN]
             ]
-            sheet.update('A1:J1', [headers])
-        
-        # Prepare timing string
-        timing_str = []
-        if prescription["Morning"] == "yes":
-            timing_str.append("Morning")
-        if prescription["Afternoon"] == "yes":
-            timing_str.append("Afternoon")
-        if prescription["Night"] == "yes":
-            timing_str.append("Night")
-        
-        # Prepare row data
-        row = [
-            patient_name or "Unknown",
-            today,
-            prescription["Medicine Name"] or "Not specified",
-            format_duration(prescription["Duration"], prescription["Duration Unit"]),
-            prescription["Duration Unit"] or "-", 
-            ', '.join(timing_str) if timing_str else '-',
-            prescription["Food Timing"] or "-",
-            str(prescription["Times Per Day"]) or "1",
-            str(prescription["Total Tablets"]) or "0",
-            prescription["Raw Prescription"] or ""
-        ]
-        
-        # Add row to sheet
-        sheet.append_row(row)
-        sheet_status = "✅ Prescription saved to Google Sheets successfully!"
-        print(f"Successfully saved prescription: {row}")
+            imported = store.import_history(history)
+            if imported:
+                print(f"Imported {imported} prescriptions from Google Sheets")
+            return
+        except Exception as e:
+            print(f"Sheet history import failed, retrying in {retry_interval}s: {str(e)}")
+            time.sleep(retry_interval)
+            retry_interval = min(retry_interval * 2, max_retry_interval)
+
+if SHEET_EXPORT:
+    threading.Thread(target=import_sheet_history, name="sheet-import", daemon=True).start()
+    # Rows journaled but never exported before a restart go out without waiting for a save
+    write_queue.start()
+
+def save_rows(rows):
+    """Store rows locally, then queue them for export to Google Sheets"""
+    store.append_many(rows)
+    if not SHEET_EXPORT:
+        return
+    try:
+        write_queue.enqueue_many(rows)
+    except Exception as e:
+        # The rows are saved; only the export copy is missing
+        print(f"Sheet export queue error: {str(e)}")
+
+def save_prescriptions(prescriptions, patient_name, today):
+    """Queue every medication of the visit with a single bulk write"""
+    try:
+        rows = [prescription_to_row(prescription, patient_name, today) for prescription in prescriptions]
+        save_rows(rows)
+        sheet_status = "✅ Prescription saved! It will be synced to Google Sheets shortly."
+        if len(rows) > 1:
+            sheet_status = f"✅ {len(rows)} prescriptions saved! They will be synced to Google Sheets shortly."
+        print(f"Saved prescriptions: {rows}")
         
         # Clear pending data
-        session.pop('pending_prescription', None)
+        clear_cart()
         
     except Exception as e:
-        sheet_status = f"❌ Failed to save prescription to Google Sheets: {str(e)}"
-        print(f"Sheet error details: {str(e)}")
+        sheet_status = f"❌ Failed to save prescription: {str(e)}"
+        print(f"Save error details: {str(e)}")
         print(f"Exception type: {type(e)}")
         
         # Additional debugging
@@ -653,41 +638,191 @@ def save_prescription(prescription, patient_name, today):
         except:
             pass
     
-    # Prepare timing string for display
-    timing_str = []
-    if prescription["Morning"] == "yes":
-        timing_str.append("Morning")
-    if prescription["Afternoon"] == "yes":
-        timing_str.append("Afternoon")
-    if prescription["Night"] == "yes":
-        timing_str.append("Night")
-    
-    formatted = f"""
-        <b>Final Saved Prescription:</b><br>
-        Patient: {patient_name}<br>
-        Date: {today}<br>
+    saved = []
+    for prescription in prescriptions:
+        timing_str = format_timing(prescription)
+        saved.append(f"""
         Medicine: {prescription['Medicine Name']}<br>
         Duration: {prescription['Duration']} {prescription['Duration Unit']}<br>
-        Timing: {', '.join(timing_str) if timing_str else 'Not specified'}<br>
+        Timing: {timing_str or 'Not specified'}<br>
         Food Timing: {prescription['Food Timing']}<br>
         Times per day: {prescription['Times Per Day']}<br>
         Total tablets needed: {prescription['Total Tablets']}<br>
+        """)
+    
+    formatted = f"""
+        <b>Final Saved Prescription{'s' if len(saved) > 1 else ''}:</b><br>
+        Patient: {patient_name}<br>
+        Date: {today}<br>
+        {'<br>'.join(saved)}
         <br><b>{sheet_status}</b><br>
         <br>Thank you! You can enter another prescription anytime.<br>
     """
     return jsonify({"message": formatted})
 
+MAX_BATCH_SIZE = 50
+
+@app.route('/prescriptions/batch', methods=['POST'])
+def save_prescription_batch():
+    """
+    Extract and save a whole order of prescriptions for one patient.
+
+    Body: {"name": "<patient>", "prescriptions": ["<text>", ...], "date": "YYYY-MM-DD" (optional)}
+
+    Texts the rule-based parsers cannot resolve share a single GROQ call, and
+    every complete prescription is saved with one bulk write. Incomplete
+    ones are returned with their missing fields and are not saved.
+    """
+    data = request.get_json(silent=True) or {}
+    patient_name = data.get('name')
+    texts = data.get('prescriptions')
+    today = data.get('date') or datetime.now().strftime("%Y-%m-%d")
+    
+    if not isinstance(patient_name, str) or not patient_name.strip():
+        return jsonify({
+            "success": False,
+            "error": "'name' is required"
+        }), 400
+    patient_name = patient_name.strip()
+    try:
+        # Stored dates must be zero-padded ISO: rollups, sorting and cursors rely on it
+        today = date.fromisoformat(str(today)).isoformat()
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "'date' must be a YYYY-MM-DD date"
+        }), 400
+    if not isinstance(texts, list) or not texts or not all(isinstance(t, str) and t.strip() for t in texts):
+        return jsonify({
+            "success": False,
+            "error": "'prescriptions' must be a non-empty list of prescription texts"
+        }), 400
+    if len(texts) > MAX_BATCH_SIZE:
+        return jsonify({
+            "success": False,
+            "error": f"At most {MAX_BATCH_SIZE} prescriptions per batch"
+        }), 400
+    
+    results = []
+    rows = []
+    for text, (prescription, timing_status) in zip(texts, extract_prescriptions(texts, extraction_backend.extract_batch)):
+        missing = missing_fields(prescription, timing_status)
+        if not missing:
+            rows.append(prescription_to_row(prescription, patient_name, today))
+        results.append({
+            "prescription": prescription,
+            "status": "incomplete" if missing else "saved",
+            "missing": missing
+        })
+    
+    try:
+        if rows:
+            save_rows(rows)
+    except Exception as e:
+        print(f"Save error details: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": f"Failed to save prescriptions: {str(e)}"
+        }), 500
+    
+    return jsonify({
+        "success": True,
+        "saved": len(rows),
+        "results": results
+    })
+
 # Admin routes for viewing data
+DEFAULT_MEDICINE_BUTTONS = ["Paracetamol", "Aspirin", "Ibuprofen", "Cetirizine"]
+
+def medicine_quick_buttons(count):
+    """Quick buttons for the clinic's most prescribed medicines"""
+    names = [suggestion["name"] for suggestion in medicine_suggester.suggest("", count)]
+    names += [name for name in DEFAULT_MEDICINE_BUTTONS if name not in names]
+    return [{"text": name, "value": f"Medicine: {name}"} for name in names[:count]]
+
+@app.route('/medicines/suggest', methods=['GET'])
+def suggest_medicines():
+    """
+    Medicine name type-ahead: ?q=<prefix>&limit=<n>. Served from the
+    in-memory prefix index, most prescribed first; no LLM or sheet access.
+    """
+    store.refresh()
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', default=10, type=int), medicine_suggester.limit))
+    return jsonify({
+        "success": True,
+        "query": query,
+        "suggestions": medicine_suggester.suggest(query, limit)
+    })
+
+def recent_prescriptions(patient_name, limit=20):
+    """A patient's latest prescriptions, newest first, from the patient index"""
+    store.refresh()
+    return store.records_by_id(patient_index.row_ids(patient_name, limit))
+
+MAX_HISTORY_LIMIT = 200
+
+@app.route('/patients/<path:name>/prescriptions', methods=['GET'])
+def get_patient_prescriptions(name):
+    """
+    A patient's prescription history, newest first. The name is matched
+    case- and whitespace-insensitively; ?limit= caps the number returned
+    (default 20, max 200).
+    """
+    limit = max(1, min(request.args.get('limit', default=20, type=int), MAX_HISTORY_LIMIT))
+    records = recent_prescriptions(name, limit)
+    return jsonify({
+        "success": True,
+        "patient": name,
+        "total": patient_index.count(name),
+        "records": records
+    })
+
 @app.route('/admin/prescriptions', methods=['GET'])
+@admin_cache.cached(before=store.refresh)
 def get_prescription_data():
-    """Get all prescription records for admin view"""
+    """
+    Get prescription records for admin view, newest first.
+
+    Query parameters:
+        limit      page size (default 100, max 1000)
+        cursor     next_cursor from the previous page
+        date_from  / date_to   inclusive YYYY-MM-DD range
+        patient    exact patient name
+        medicine   medicine name; brands and listed misspellings match
+                   their generic, as saved prescriptions are stored
+        fields     comma-separated column names to return
+        format     'ndjson' to stream every matching record, one per line
+    """
     try:
-        records = sheet.get_all_records()
-        records.sort(key=lambda x: x.get('Date', ''), reverse=True)
+        
+        filters = {
+            'date_from': request.args.get('date_from'),
+            'date_to': request.args.get('date_to'),
+            'patient': request.args.get('patient'),
+            'medicine': canonical_medicine_name(request.args.get('medicine'))
+        }
+        fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+        
+        if request.args.get('format') == 'ndjson':
+            def generate():
+                for record in store.iter_records(filters, fields):
+                    yield json.dumps(record) + "\n"
+            return Response(generate(), mimetype='application/x-ndjson')
+        
+        try:
+            limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+            records, next_cursor = store.page(filters, request.args.get('cursor'), limit, fields)
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
         
         return jsonify({
             "success": True,
-            "records": records
+            "records": records,
+            "next_cursor": next_cursor
         })
     except Exception as e:
         print(f"Error fetching prescription data: {str(e)}")
@@ -697,31 +832,15 @@ def get_prescription_data():
         }), 500
 
 @app.route('/admin/stats', methods=['GET'])
+@admin_cache.cached(before=store.refresh)
 def get_admin_stats():
     """Get statistics for admin dashboard"""
     try:
-        records = sheet.get_all_records()
         today = datetime.now().strftime("%Y-%m-%d")
         
-        total_prescriptions = len(records)
-        today_prescriptions = len([r for r in records if r.get('Date') == today])
-        unique_patients = len(set(r.get('Patient Name', '') for r in records if r.get('Patient Name')))
-        
-        # Calculate most prescribed medicine
-        medicines = {}
-        for record in records:
-            medicine = record.get('Medicine Name', '')
-            if medicine and medicine != '-':
-                medicines[medicine] = medicines.get(medicine, 0) + 1
-        
-        most_prescribed = max(medicines.items(), key=lambda x: x[1])[0] if medicines else "None"
-        
         return jsonify({
             "success": True,
-            "totalPrescriptions": total_prescriptions,
-            "todayPrescriptions": today_prescriptions,
-            "uniquePatients": unique_patients,
-            "mostPrescribed": most_prescribed
+            **prescription_stats.snapshot(today)
         })
     except Exception as e:
         print(f"Error calculating stats: {str(e)}")
@@ -730,6 +849,117 @@ def get_admin_stats():
             "error": str(e)
         }), 500
 
+MAX_TREND_PERIODS = 732
+
+@app.route('/admin/trends', methods=['GET'])
+@admin_cache.cached(before=store.refresh)
+def get_trends():
+    """
+    Prescription and tablet counts per day or week from the rollups.
+
+    Query parameters:
+        bucket     'day' (default) or 'week'
+        date_from  / date_to   inclusive YYYY-MM-DD range (default: the last
+                   30 days, or 12 weeks for bucket=week)
+        medicine   series for one medicine instead of all prescriptions
+        top        also return series for the N most prescribed medicines
+    """
+    bucket = request.args.get('bucket', 'day')
+    try:
+        if bucket not in BUCKETS:
+            raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+        date_to = request.args.get('date_to') or datetime.now().strftime("%Y-%m-%d")
+        default_from = datetime.strptime(date_to, "%Y-%m-%d") - timedelta(days=29 if bucket == 'day' else 83)
+        date_from = request.args.get('date_from') or default_from.strftime("%Y-%m-%d")
+        datetime.strptime(date_from, "%Y-%m-%d")
+        if date_from > date_to:
+            raise ValueError("date_from must not be after date_to")
+        top = min(request.args.get('top', default=0, type=int), 20)
+        
+        if period_count(bucket, date_from, date_to) > MAX_TREND_PERIODS:
+            raise ValueError(f"At most {MAX_TREND_PERIODS} periods per request")
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    
+    # Rollups are keyed on canonical names ("dolo" is counted as Paracetamol)
+    medicine = request.args.get('medicine')
+    if medicine:
+        medicine = canonical_medicine_name(medicine)
+    
+    response = {
+        "success": True,
+        "bucket": bucket,
+        "date_from": date_from,
+        "date_to": date_to,
+        "medicine": medicine,
+        "series": rollups.series(bucket, date_from, date_to, medicine)
+    }
+    if top > 0:
+        response["medicines"] = [
+            {"name": name, "prescriptions": count, "series": rollups.series(bucket, date_from, date_to, name)}
+            for name, count in rollups.top_medicines(date_from, date_to, top)
+        ]
+    return jsonify(response)
+
+MAX_FORECAST_DAYS = 366
+
+@app.route('/admin/forecast', methods=['GET'])
+@admin_cache.cached(before=store.refresh)
+def get_demand_forecast():
+    """
+    Tablets needed per medicine per day across all active prescriptions.
+
+    Query parameters:
+        start     first day, YYYY-MM-DD (default today)
+        weeks     horizon in weeks (default 4), or
+        days      horizon in days
+        medicine  only this medicine
+        limit     at most this many medicines, highest demand first
+    """
+    try:
+        start = datetime.strptime(request.args['start'], "%Y-%m-%d").date() if request.args.get('start') \
+            else datetime.now().date()
+        days = int(request.args.get('days') or int(request.args.get('weeks', 4)) * 7)
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be at least 1")
+        # Forecasts are keyed on canonical names, like the rollups
+        medicine = request.args.get('medicine')
+        if medicine:
+            medicine = canonical_medicine_name(medicine)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    if not 1 <= days <= MAX_FORECAST_DAYS:
+        return jsonify({
+            "success": False,
+            "error": f"Horizon must be between 1 and {MAX_FORECAST_DAYS} days"
+        }), 400
+    
+    return jsonify({
+        "success": True,
+        **demand_forecaster.summary(start, days, medicine, limit)
+    })
+
+@app.route('/admin/metrics', methods=['GET'])
+def get_admin_metrics():
+    """Runtime metrics for the extraction pipeline"""
+    return jsonify({
+        "success": True,
+        "extraction_backend": extraction_backend.name,
+        "sheet_export": {
+            "enabled": SHEET_EXPORT,
+            "pending_rows": write_queue.pending_count()
+        },
+        "llm_usage": usage_meter.snapshot(),
+        **extraction_backend.stats()
+    })
+
 @app.route('/admin/dashboard')
 def admin_dashboard():
     return render_template('prescription_admin.html')
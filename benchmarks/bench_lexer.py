@@ -0,0 +1,184 @@
+"""
+Microbenchmark: single-pass prescription lexer vs. the multi-scan parsers
+it replaced.
+
+The legacy functions below are verbatim copies of parse_duration,
+parse_food_timing, parse_frequency and extract_medicine_name as they were
+before prescription_lexer existed; each lowercases the text and runs its own
+list of uncompiled patterns and substring scans.
+
+    python benchmarks/bench_lexer.py [--repeat N]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prescription_lexer import lex
+
+CORPUS = [
+    "take paracetamol 2 times a day for 3 days before food",
+    "aspirin in the morning and night for 1 week after food",
+    "paracetamol for 5 days morning and evening",
+    "take amoxicillin 500mg three times daily for 7 days",
+    "ibuprofen 400mg twice a day after meals for 5 days",
+    "take vitamin D once daily in the morning for 1 month",
+    "paracetamol 650mg every 6 hours for fever for 3 days",
+    "take omeprazole 20mg once daily before breakfast for 2 weeks",
+    "dolo 3 times a day for 5 days after food",
+    "metformin 1x day with meal for 3 months",
+]
+
+
+def legacy_parse_duration(duration_str):
+    """Parse duration string and return normalized format"""
+    duration_str = duration_str.strip().lower()
+    
+    # Extract number and unit
+    duration_match = re.search(r'(\d+)\s*(day|days|week|weeks|month|months|d|w|m)', duration_str)
+    if duration_match:
+        number = int(duration_match.group(1))
+        unit = duration_match.group(2)
+        
+        # Normalize unit
+        if unit in ['day', 'days', 'd']:
+            return number, 'days'
+        elif unit in ['week', 'weeks', 'w']:
+            return number, 'weeks'
+        elif unit in ['month', 'months', 'm']:
+            return number, 'months'
+    
+    return None, None
+
+def legacy_parse_food_timing(prescription_text):
+    """Parse food timing from prescription text"""
+    text = prescription_text.lower()
+    
+    # Check for before food indicators
+    before_food_patterns = [
+        r'before\s+food',
+        r'before\s+meal',
+        r'before\s+eating',
+        r'empty\s+stomach',
+        r'on\s+empty\s+stomach'
+    ]
+    
+    # Check for after food indicators
+    after_food_patterns = [
+        r'after\s+food',
+        r'after\s+meal',
+        r'after\s+eating',
+        r'with\s+food',
+        r'with\s+meal'
+    ]
+    
+    # Check before food patterns first
+    for pattern in before_food_patterns:
+        if re.search(pattern, text):
+            return "before food"
+    
+    for pattern in after_food_patterns:
+        if re.search(pattern, text):
+            return "after food"
+    
+    return None
+
+def legacy_parse_frequency(freq_str):
+    """Parse frequency and timing from prescription text"""
+    freq_str = freq_str.strip().lower()
+
+    timings = {
+        'morning': False,
+        'afternoon': False,
+        'night': False
+    }
+
+    # Look for keywords that suggest timing
+    if any(word in freq_str for word in ['morning', 'morn', 'am', 'breakfast']):
+        timings['morning'] = True
+    if any(word in freq_str for word in ['afternoon', 'lunch', 'noon', 'pm']):
+        timings['afternoon'] = True
+    if any(word in freq_str for word in ['night', 'evening', 'dinner', 'bedtime', 'sleep']):
+        timings['night'] = True
+
+    # Improved regex to catch more patterns
+    frequency_patterns = [
+        r'for\s+(\d+)\s*times?\s*(?:a\s*)?day',
+        r'(\d+)\s*times?\s*(?:a\s*)?day',
+        r'(\d+)\s*times?\s*daily',
+        r'(\d+)[x×]\s*day',
+        r'(\d+)\s*/\s*day'
+    ]
+
+    times_per_day = 1  # Default fallback
+    for pattern in frequency_patterns:
+        match = re.search(pattern, freq_str)
+        if match:
+            times_per_day = int(match.group(1))
+            break
+
+    # If timing not explicitly mentioned, infer from times_per_day
+    if not any(timings.values()) and times_per_day > 0:
+        if times_per_day == 1:
+            timings['morning'] = True
+        elif times_per_day == 2:
+            timings['morning'] = True
+            timings['night'] = True
+        elif times_per_day == 3:
+            timings['morning'] = True
+            timings['afternoon'] = True
+            timings['night'] = True
+
+    return timings, times_per_day, "complete" if any(timings.values()) else "timing_needed"
+
+def legacy_extract_medicine_name(prescription_text):
+    """Extract medicine name from prescription text"""
+    text = prescription_text.lower()
+    
+    # Remove common prefixes and clean text
+    text = re.sub(r'^(take\s+(the\s+)?|have\s+)', '', text)
+    
+    # Look for medicine name patterns
+    medicine_patterns = [
+        r'^([a-zA-Z][a-zA-Z\s]*?)\s+(?:\d+|tablet|twice|once|morning|afternoon|night|before|after|for)',
+        r'^([a-zA-Z][a-zA-Z\s]*?)\s+(?:\d+\s*times)',
+        r'^([a-zA-Z][a-zA-Z\s]*?)\s+(?:for\s+\d+)',
+        r'^([a-zA-Z][a-zA-Z\s]*?)(?:\s+\d+|\s+tablet|\s+twice|\s+once)'
+    ]
+    
+    for pattern in medicine_patterns:
+        match = re.search(pattern, text)
+        if match:
+            medicine_name = match.group(1).strip()
+            # Filter out common words that aren't medicine names
+            if medicine_name not in ['the', 'for', 'take', 'tablet', 'tablets', 'times', 'day', 'days', 'in', 'and', 'or', 'have']:
+                return medicine_name.title()
+    
+    return "Not specified"
+
+
+def legacy_parse(text):
+    return (
+        legacy_extract_medicine_name(text),
+        legacy_parse_duration(text),
+        legacy_parse_frequency(text),
+        legacy_parse_food_timing(text),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000, help="passes over the corpus")
+    args = parser.parse_args()
+
+    for name, fn in [("legacy (4 parsers)", legacy_parse), ("lexer (1 pass)", lex)]:
+        seconds = timeit.timeit(lambda: [fn(text) for text in CORPUS], number=args.repeat)
+        calls = args.repeat * len(CORPUS)
+        print(f"{name:<20} {calls / seconds:>12,.0f} msgs/s  {seconds / calls * 1e6:8.2f} us/msg")
+
+
+if __name__ == "__main__":
+    main()
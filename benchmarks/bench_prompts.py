@@ -0,0 +1,115 @@
+"""
+Prompt benchmark: extraction accuracy vs. token cost for every prompt
+version in the registry (prompts.py).
+
+Each version extracts the same fixed corpus through the live GROQ API
+(GROQ_API_KEY must be set). Field accuracy is measured against the hand
+labelled expectations below; token counts and latency come from the
+usage meter that also feeds /admin/metrics. --offline skips the API and
+only compares prompt sizes.
+
+    python benchmarks/bench_prompts.py [--versions v1,v3] [--offline]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from groq_api import GROQ_MODEL, ExtractionError, _request_completion, parse_extraction, usage_meter
+from prompts import PROMPTS
+
+# (text, expected fields); fields left out are not scored
+CORPUS = [
+    ("take paracetamol 2 times a day for 3 days",
+     {"medicine": "paracetamol", "duration": 3, "duration_unit": "days", "times_per_day": 2}),
+    ("aspirin in the morning and night for 1 week",
+     {"medicine": "aspirin", "duration": 1, "duration_unit": "weeks", "morning": True, "afternoon": False,
+      "night": True, "times_per_day": 2}),
+    ("paracetamol for 5 days morning and evening",
+     {"medicine": "paracetamol", "duration": 5, "duration_unit": "days", "morning": True, "night": True,
+      "times_per_day": 2}),
+    ("take amoxicillin 500mg three times daily for 7 days",
+     {"medicine": "amoxicillin", "strength": "500mg", "duration": 7, "duration_unit": "days", "times_per_day": 3}),
+    ("ibuprofen 400mg twice a day after meals for 5 days",
+     {"medicine": "ibuprofen", "strength": "400mg", "duration": 5, "duration_unit": "days", "times_per_day": 2,
+      "food_timing": "after food"}),
+    ("take vitamin D once daily in the morning for 1 month",
+     {"medicine": "vitamin d", "duration": 1, "duration_unit": "months", "morning": True, "times_per_day": 1}),
+    ("paracetamol 650mg every 6 hours for fever for 3 days",
+     {"medicine": "paracetamol", "strength": "650mg", "duration": 3, "duration_unit": "days", "times_per_day": 4}),
+    ("take omeprazole 20mg once daily before breakfast for 2 weeks",
+     {"medicine": "omeprazole", "strength": "20mg", "duration": 2, "duration_unit": "weeks", "morning": True,
+      "times_per_day": 1, "food_timing": "before food"}),
+    ("dolo 3 times a day for 5 days after food",
+     {"medicine": "dolo", "duration": 5, "duration_unit": "days", "times_per_day": 3, "food_timing": "after food"}),
+    ("metformin 500 mg with breakfast and dinner for 3 months",
+     {"medicine": "metformin", "duration": 3, "duration_unit": "months", "morning": True, "night": True,
+      "times_per_day": 2, "food_timing": "after food"}),
+    ("cetirizine 10mg at bedtime for 10 days",
+     {"medicine": "cetirizine", "strength": "10mg", "duration": 10, "duration_unit": "days", "night": True,
+      "times_per_day": 1}),
+    ("pantoprazole 40mg empty stomach morning for 4 weeks",
+     {"medicine": "pantoprazole", "strength": "40mg", "duration": 4, "duration_unit": "weeks", "morning": True,
+      "times_per_day": 1, "food_timing": "before food"}),
+]
+
+
+def field_matches(field, expected, actual):
+    if field == "medicine":
+        return actual is not None and expected in actual.lower()
+    if field == "strength":
+        return actual is not None and expected == actual.lower().replace(" ", "")
+    return expected == actual
+
+
+def run_version(template):
+    """Extract the corpus with one template; returns (valid responses, correct fields, scored fields)"""
+    valid = correct = scored = 0
+    for text, expected in CORPUS:
+        scored += len(expected)
+        try:
+            response = _request_completion(template.render(text), template.max_tokens, prompt_version=template.version)
+            extraction = parse_extraction(response)
+        except ExtractionError as e:
+            print(f"  {template.version}: rejected response for {text!r}: {e}")
+            continue
+        except Exception as e:
+            print(f"  {template.version}: request failed for {text!r}: {e}")
+            continue
+        valid += 1
+        correct += sum(1 for field, value in expected.items() if field_matches(field, value, extraction[field]))
+    return valid, correct, scored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--versions", default=",".join(PROMPTS), help="comma separated prompt versions")
+    parser.add_argument("--offline", action="store_true", help="only compare prompt sizes, no API calls")
+    args = parser.parse_args()
+
+    templates = [PROMPTS[version] for version in args.versions.split(",")]
+
+    if args.offline:
+        print(f"{'version':<8} {'chars/prompt':>12} {'~tokens/prompt':>15} {'max_tokens':>11}")
+        for template in templates:
+            chars = sum(len(template.render(text)) for text, _ in CORPUS) / len(CORPUS)
+            # ~4 characters per token is close enough to rank templates
+            print(f"{template.version:<8} {chars:>12.0f} {chars / 4:>15.0f} {template.max_tokens:>11}")
+        return
+
+    results = [(template, run_version(template)) for template in templates]
+    usage = usage_meter.snapshot()["by_prompt"]
+
+    print(f"\n{'version':<8} {'prompt tok':>10} {'compl tok':>10} {'p50 s':>7} {'valid':>7} {'accuracy':>9}")
+    for template, (valid, correct, scored) in results:
+        group = usage.get(f"{GROQ_MODEL}/{template.version}", {})
+        print(
+            f"{template.version:<8} {group.get('avg_prompt_tokens') or 0:>10} "
+            f"{group.get('avg_completion_tokens') or 0:>10} {group.get('p50_latency') or 0:>7.2f} "
+            f"{valid:>3}/{len(CORPUS):<3} {correct / scored:>9.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Benchmark suite: the rule-based parsers, the /message chat flow end to end
+and the admin endpoints at growing store sizes, all on a synthetic
+prescription corpus.
+
+Runs offline and reproducibly (--seed). The store, session database and
+write-behind journal live in a temporary directory, EXTRACTION_BACKEND=rules
+stands in for GROQ, and the Sheets export goes to a local stub that
+discards rows. Latencies are per call: throughput plus p50/p95/p99 in
+microseconds. --output writes the same numbers as JSON so runs on two
+commits can be compared.
+
+    python benchmarks/bench_suite.py [--sizes 1000,100000,1000000] [--messages 300]
+                                     [--repeat 20] [--seed 7] [--output results.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from extraction import extract_medicine_name, parse_duration, parse_food_timing, parse_frequency
+from formulary import get_formulary
+from groq_api import manual_prescription_parse
+
+# ----------------------------------------------------------------------
+# Synthetic corpus
+# ----------------------------------------------------------------------
+PREFIXES = ["", "", "take ", "tab "]
+STRENGTHS = ["", "", "250mg", "500mg", "650mg", "10 mg", "40mg"]
+FREQUENCIES = [
+    ("once a day", 1), ("once daily in the morning", 1), ("at bedtime", 1), ("at night", 1),
+    ("twice a day", 2), ("2 times a day", 2), ("morning and night", 2), ("in the morning and evening", 2),
+    ("three times daily", 3), ("3 times a day", 3), ("morning, afternoon and night", 3), ("every 8 hours", 3),
+    ("every 6 hours", 4), ("", None)
+]
+DURATION_UNITS = [("days", 1, 14), ("weeks", 1, 6), ("months", 1, 3)]
+FOOD_TIMINGS = ["after food", "before food", "after meals", "empty stomach", ""]
+
+
+def medicine_names():
+    """Every name the formulary knows (generics and brands), sorted for a stable seed"""
+    return sorted({key for key, _ in get_formulary().names_with_prefix("")})
+
+
+def generate_prescription(rng, names):
+    """One free-text prescription the way a doctor types it"""
+    duration_unit, low, high = rng.choice(DURATION_UNITS)
+    duration = rng.randint(low, high)
+    frequency = rng.choice(FREQUENCIES)[0]
+    tail = [
+        frequency,
+        f"for {duration} {duration_unit[:-1] if duration == 1 else duration_unit}",
+        rng.choice(FOOD_TIMINGS)
+    ]
+    rng.shuffle(tail)
+    head = f"{rng.choice(PREFIXES)}{rng.choice(names)} {rng.choice(STRENGTHS)}"
+    return " ".join(part for part in [head.strip()] + tail if part)
+
+
+def generate_corpus(count, seed=7):
+    rng = random.Random(seed)
+    names = medicine_names()
+    return [generate_prescription(rng, names) for _ in range(count)]
+
+
+def generate_rows(count, seed=7, end=None, span_days=730):
+    """
+    Stored prescription rows in SHEET_HEADERS order: a patient pool of about
+    one patient per 20 prescriptions, dates over the last two years
+    """
+    rng = random.Random(seed)
+    names = [name.title() for name in medicine_names()]
+    end = end or date.today()
+    patients = max(1, count // 20)
+    slots = [["Morning"], ["Night"], ["Morning", "Night"], ["Morning", "Afternoon", "Night"]]
+
+    for _ in range(count):
+        duration_unit, low, high = rng.choice(DURATION_UNITS)
+        duration = rng.randint(low, high)
+        timing = rng.choice(slots)
+        days = duration * {"days": 1, "weeks": 7, "months": 30}[duration_unit]
+        yield [
+            f"Patient {rng.randrange(patients)}",
+            (end - timedelta(days=rng.randrange(span_days))).isoformat(),
+            rng.choice(names),
+            f"{duration} {duration_unit}",
+            duration_unit,
+            ", ".join(timing),
+            rng.choice(["after food", "before food"]),
+            str(len(timing)),
+            str(days * len(timing)),
+            ""
+        ]
+
+
+# ----------------------------------------------------------------------
+# Measurement
+# ----------------------------------------------------------------------
+def summarize(samples):
+    """Throughput and nearest-rank percentiles of per-call durations (seconds)"""
+    ordered = sorted(samples)
+    total = sum(ordered)
+
+    def percentile(p):
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] * 1e6
+
+    return {
+        "calls": len(ordered),
+        "ops_per_sec": round(len(ordered) / total, 1) if total else None,
+        "mean_us": round(total / len(ordered) * 1e6, 2),
+        "p50_us": round(percentile(50), 2),
+        "p95_us": round(percentile(95), 2),
+        "p99_us": round(percentile(99), 2)
+    }
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def print_result(label, result):
+    print(f"  {label:<34} {result['ops_per_sec'] or 0:>12,.1f} ops/s  p50 {result['p50_us']:>10,.1f} us"
+          f"  p95 {result['p95_us']:>10,.1f} us  p99 {result['p99_us']:>10,.1f} us")
+
+
+# ----------------------------------------------------------------------
+# Benchmarks
+# ----------------------------------------------------------------------
+PARSERS = [
+    ("parse_duration", parse_duration),
+    ("parse_frequency", parse_frequency),
+    ("parse_food_timing", parse_food_timing),
+    ("extract_medicine_name", extract_medicine_name),
+    ("manual_prescription_parse", manual_prescription_parse)
+]
+
+
+def bench_parsers(corpus, repeat):
+    print(f"Parsers ({len(corpus)} prescriptions x {repeat})")
+    results = {}
+    for name, fn in PARSERS:
+        samples = [timed(fn, text)[0] for _ in range(repeat) for text in corpus]
+        results[name] = summarize(samples)
+        print_result(name, results[name])
+    return results
+
+
+def load_app(workdir):
+    """Import app.py against a scratch store with GROQ and Sheets replaced by local stubs"""
+    os.environ["STORE_PATH"] = os.path.join(workdir, "prescriptions.sqlite3")
+    os.environ["SESSION_DB_PATH"] = os.path.join(workdir, "sessions.sqlite3")
+    os.environ["WRITE_QUEUE_PATH"] = os.path.join(workdir, "prescription_queue.journal")
+    os.environ["EXTRACTION_BACKEND"] = "rules"
+    os.environ["SHEET_EXPORT"] = "0"  # no history import from the real sheet
+    os.environ.setdefault("SESSION_BACKEND", "sqlite")
+
+    import app
+
+    # Keep the export path (journal + write-behind thread) in the measurement,
+    # with a sheet that accepts every batch instantly
+    exported = []
+    app.SHEET_EXPORT = True
+    app.write_queue.flush_fn = lambda rows: exported.extend(rows)
+    app.write_queue.tail_fn = lambda count: exported[-count:]
+    return app
+
+
+def bench_message(app, corpus):
+    """New prescription -> confirmation card -> 'yes', one chat session per prescription"""
+    print(f"/message end to end ({len(corpus)} conversations)")
+    client = app.app.test_client()
+    parse_samples, save_samples, outcomes = [], [], {"confirmed": 0, "needs_input": 0}
+
+    # The app logs every save; keep that out of the report (but in the timing)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for number, text in enumerate(corpus):
+            patient = f"Bench {number}"
+            client.post('/start_chat', json={"name": patient})
+            seconds, response = timed(client.post, '/message', json={"message": text, "name": patient})
+            parse_samples.append(seconds)
+
+            buttons = [button["value"] for button in response.get_json().get("quick_buttons", [])]
+            if "yes" not in buttons:
+                outcomes["needs_input"] += 1
+                continue
+            outcomes["confirmed"] += 1
+            seconds, _ = timed(client.post, '/message', json={"message": "yes", "name": patient})
+            save_samples.append(seconds)
+        app.write_queue.flush()
+
+    results = {"prescription": summarize(parse_samples), **outcomes}
+    print_result("prescription -> confirmation", results["prescription"])
+    if save_samples:
+        results["confirm_save"] = summarize(save_samples)
+        print_result("'yes' -> saved", results["confirm_save"])
+    print(f"  {outcomes['confirmed']} confirmed, {outcomes['needs_input']} asked for missing fields")
+    return results
+
+
+def admin_requests(app, today):
+    """(label, path) for every admin read, with arguments that hit real data"""
+    medicine = app.store.top_values("Medicine Name")[0][0]
+    month_ago = (today - timedelta(days=30)).isoformat()
+
+    cursor = None
+    client = app.app.test_client()
+    for _ in range(10):
+        cursor = client.get(f'/admin/prescriptions?limit=100&fields=Date&cursor={cursor or ""}').get_json()["next_cursor"]
+        if cursor is None:
+            break
+
+    requests = [
+        ("prescriptions first page", "/admin/prescriptions?limit=100"),
+        ("prescriptions page 11", f"/admin/prescriptions?limit=100&cursor={cursor or ''}"),
+        ("prescriptions by medicine", f"/admin/prescriptions?limit=100&medicine={medicine}"),
+        ("prescriptions last 30 days", f"/admin/prescriptions?limit=100&date_from={month_ago}"),
+        ("stats", "/admin/stats"),
+        ("trends 30 days", "/admin/trends?top=5"),
+        ("trends 1 year weekly", f"/admin/trends?bucket=week&date_from={(today - timedelta(days=364)).isoformat()}"),
+        ("forecast 4 weeks", "/admin/forecast?limit=20"),
+        ("metrics", "/admin/metrics"),
+        ("patient history", "/patients/Patient 1/prescriptions"),
+        ("medicine suggest", "/medicines/suggest?q=para")
+    ]
+    return requests
+
+
+def bench_admin(app, sizes, repeat, seed):
+    client = app.app.test_client()
+    today = date.today()
+    results = {}
+    loaded = app.store.count()
+
+    for size in sizes:
+        print(f"Admin endpoints at {size:,} rows ({repeat} requests each, uncached / cached)")
+        rows = list(generate_rows(max(0, size - loaded), seed=seed + size, end=today))
+        start = time.perf_counter()
+        for offset in range(0, len(rows), 50000):
+            app.store.append_many(rows[offset:offset + 50000])
+        load_seconds = time.perf_counter() - start
+        loaded = app.store.count()
+        print(f"  loaded {len(rows):,} rows in {load_seconds:.2f}s ({len(rows) / max(load_seconds, 1e-9):,.0f} rows/s)")
+
+        endpoints = {}
+        for label, path in admin_requests(app, today):
+            uncached = []
+            for _ in range(repeat):
+                app.admin_cache.invalidate()
+                uncached.append(timed(client.get, path)[0])
+            cached = [timed(client.get, path)[0] for _ in range(repeat)]
+            endpoints[label] = {"path": path, "uncached": summarize(uncached), "cached": summarize(cached)}
+            print_result(label, endpoints[label]["uncached"])
+
+        results[str(size)] = {
+            "rows": loaded,
+            "load_seconds": round(load_seconds, 3),
+            "endpoints": endpoints
+        }
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="comma-separated store sizes for the admin endpoints")
+    parser.add_argument("--corpus", type=int, default=1000, help="synthetic prescriptions for the parser benchmark")
+    parser.add_argument("--repeat", type=int, default=20, help="passes over the corpus / requests per admin endpoint")
+    parser.add_argument("--messages", type=int, default=300, help="chat conversations for the /message benchmark")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(",") if size.strip())
+
+    corpus = generate_corpus(args.corpus, seed=args.seed)
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "corpus": args.corpus,
+            "repeat": args.repeat
+        },
+        "parsers": bench_parsers(corpus, args.repeat)
+    }
+
+    with tempfile.TemporaryDirectory(prefix="prescription-bench-") as workdir:
+        app = load_app(workdir)
+        results["message"] = bench_message(app, generate_corpus(args.messages, seed=args.seed + 1))
+        results["admin"] = bench_admin(app, sizes, args.repeat, args.seed)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
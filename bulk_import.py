@@ -0,0 +1,170 @@
+"""
+Bulk import / reparse of historical free-text prescriptions.
+
+Streams a CSV or JSONL file, runs every prescription through the same
+extraction as /message (rule-based lexer in a process pool, the extraction
+backend only for texts the rules cannot resolve and only with --llm), and
+writes normalised rows in chunks. Memory use is bounded by --chunk-size
+regardless of input size. Progress is checkpointed after each chunk;
+rerunning the same command resumes where it stopped.
+
+    python bulk_import.py legacy.csv normalized.csv --text-column prescription
+    python bulk_import.py legacy.jsonl normalized.jsonl --llm --llm-concurrency 4
+    python bulk_import.py legacy.csv normalized.csv --llm --backend local
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+from extraction import SHEET_HEADERS, local_extract, apply_groq_response, missing_fields, prescription_to_row
+from extraction_backends import make_extraction_backend
+
+OUTPUT_HEADERS = SHEET_HEADERS + ["Status", "Missing"]
+
+
+def file_format(path, override=None):
+    if override:
+        return override
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def read_records(path, fmt):
+    """Yield input records one at a time as dicts"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            for record in csv.DictReader(f):
+                yield record
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def parse_record(args):
+    """Process-pool worker: rule-based extraction for one input record"""
+    text, patient, date = args
+    prescription, timing_status, confident = local_extract(text)
+    return prescription, timing_status, confident, patient, date
+
+
+def load_checkpoint(path, input_path):
+    if not os.path.exists(path):
+        return {"records_done": 0, "output_bytes": 0}
+    with open(path, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("input") != os.path.abspath(input_path):
+        sys.exit(f"Checkpoint {path} belongs to {checkpoint.get('input')}; remove it to start over")
+    return checkpoint
+
+
+def save_checkpoint(path, input_path, records_done, output_bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "input": os.path.abspath(input_path),
+            "records_done": records_done,
+            "output_bytes": output_bytes
+        }, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def refine_with_llm(backend, items, concurrency, batch_size):
+    """Send the low-confidence items to the extraction backend in batches, a few batches at a time"""
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        responses = pool.map(
+            lambda batch: backend.extract_batch([item[0]["Raw Prescription"] for item in batch]),
+            batches
+        )
+        for batch, batch_responses in zip(batches, responses):
+            for item, response in zip(batch, batch_responses):
+                apply_groq_response(item[0], response)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import / reparse historical prescriptions")
+    parser.add_argument("input", help="CSV or JSONL file of legacy prescriptions")
+    parser.add_argument("output", help="CSV or JSONL file to write normalised rows to")
+    parser.add_argument("--input-format", choices=["csv", "jsonl"])
+    parser.add_argument("--output-format", choices=["csv", "jsonl"])
+    parser.add_argument("--text-column", default="prescription")
+    parser.add_argument("--patient-column", default="patient")
+    parser.add_argument("--date-column", default="date")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes for the regex path")
+    parser.add_argument("--llm", action="store_true", help="use a model for texts the rules cannot resolve")
+    parser.add_argument("--backend", choices=["groq", "local"], help="extraction backend (default: EXTRACTION_BACKEND)")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="batches in flight at once")
+    parser.add_argument("--llm-batch", type=int, default=10, help="prescriptions per batch")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <output>.checkpoint)")
+    args = parser.parse_args(argv)
+
+    input_format = file_format(args.input, args.input_format)
+    output_format = file_format(args.output, args.output_format)
+    checkpoint_path = args.checkpoint or args.output + ".checkpoint"
+    checkpoint = load_checkpoint(checkpoint_path, args.input)
+    records_done = checkpoint["records_done"]
+    today = datetime.now().strftime("%Y-%m-%d")
+    backend = make_extraction_backend(args.backend) if args.llm else None
+
+    # Drop anything written after the last checkpoint, then append
+    output = open(args.output, "a+", newline="", encoding="utf-8")
+    output.truncate(checkpoint["output_bytes"])
+    output.seek(0, os.SEEK_END)
+    writer = csv.writer(output) if output_format == "csv" else None
+    if writer and output.tell() == 0:
+        writer.writerow(OUTPUT_HEADERS)
+
+    if records_done:
+        print(f"Resuming after {records_done} records")
+
+    records = islice(read_records(args.input, input_format), records_done, None)
+    stats = {"complete": 0, "incomplete": 0, "llm": 0}
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        while True:
+            chunk = [
+                (str(record.get(args.text_column) or ""), record.get(args.patient_column), record.get(args.date_column) or today)
+                for record in islice(records, args.chunk_size)
+            ]
+            if not chunk:
+                break
+
+            parsed = list(pool.map(parse_record, chunk, chunksize=max(1, len(chunk) // (args.workers * 4))))
+
+            unsure = [item for item in parsed if not item[2]]
+            if args.llm and unsure:
+                refine_with_llm(backend, unsure, args.llm_concurrency, args.llm_batch)
+                stats["llm"] += len(unsure)
+
+            for prescription, timing_status, _, patient, date in parsed:
+                missing = missing_fields(prescription, timing_status)
+                status = "incomplete" if missing else "complete"
+                stats[status] += 1
+                row = prescription_to_row(prescription, patient, date) + [status, "; ".join(missing)]
+                if writer:
+                    writer.writerow(row)
+                else:
+                    output.write(json.dumps(dict(zip(OUTPUT_HEADERS, row))) + "\n")
+
+            output.flush()
+            os.fsync(output.fileno())
+            records_done += len(chunk)
+            save_checkpoint(checkpoint_path, args.input, records_done, output.tell())
+            print(f"Processed {records_done} records "
+                  f"({stats['complete']} complete, {stats['incomplete']} incomplete, {stats['llm']} sent to {backend.name if backend else 'no model'})")
+
+    output.close()
+    print(f"Done: {records_done} records written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
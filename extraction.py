@@ -0,0 +1,261 @@
+from formulary import canonical_medicine_name, get_formulary, is_known_medicine
+from prescription_lexer import lex, extract_medicine
+
+SHEET_HEADERS = [
+    "Patient Name", "Date", "Medicine Name", "Duration",
+    "Duration Unit", "Timing", "Food Timing", "Times Per Day",
+    "Total Tablets", "Raw Prescription"
+]
+
+def parse_duration(duration_str):
+    """Parse duration string and return normalized format"""
+    return lex(duration_str)["duration"]
+
+def parse_food_timing(prescription_text):
+    """Parse food timing from prescription text ("before" wins over "after")"""
+    return lex(prescription_text)["food_timing"]
+
+def timings_from_lex(tokens):
+    """Resolve slots, times per day and timing status from a lex() result"""
+    timings = dict(tokens["slots"])
+    named_slots = sum(1 for value in timings.values() if value)
+    
+    # Explicit frequency wins; otherwise one tablet per named slot
+    times_per_day = tokens["times_per_day"] or named_slots or 1
+    
+    # If timing not explicitly mentioned, infer from times_per_day
+    if not named_slots:
+        if times_per_day == 1:
+            timings['morning'] = True
+        elif times_per_day == 2:
+            timings['morning'] = True
+            timings['night'] = True
+        elif times_per_day == 3:
+            timings['morning'] = True
+            timings['afternoon'] = True
+            timings['night'] = True
+    
+    return timings, times_per_day, "complete" if any(timings.values()) else "timing_needed"
+
+def parse_frequency(freq_str):
+    """Parse frequency and timing from prescription text"""
+    return timings_from_lex(lex(freq_str))
+
+def calculate_total_tablets(duration_num, duration_unit, timings, times_per_day):
+    """Calculate total tablet count based on accurate times per day"""
+    try:
+        # Convert duration to days
+        if duration_unit == 'days':
+            total_days = duration_num
+        elif duration_unit == 'weeks':
+            total_days = duration_num * 7
+        elif duration_unit == 'months':
+            total_days = duration_num * 30  # Approximate
+        else:
+            total_days = duration_num  # fallback
+
+        # Use times_per_day directly as the actual frequency
+        total_tablets = total_days * times_per_day
+        return total_tablets
+
+    except Exception as e:
+        print(f"Error calculating total tablets: {str(e)}")
+        return 0
+
+def extract_medicine_name(prescription_text):
+    """Extract medicine name from prescription text"""
+    return extract_medicine(prescription_text.lower()) or "Not specified"
+
+def new_prescription(prescription_text):
+    """Empty pending-prescription dict for a raw message"""
+    return {
+        "Medicine Name": "Not specified",
+        "Duration": "-",
+        "Duration Unit": "-",
+        "Morning": "no",
+        "Afternoon": "no",
+        "Night": "no",
+        "Times Per Day": 1,
+        "Food Timing": "-",
+        "Total Tablets": 0,
+        "Raw Prescription": prescription_text
+    }
+
+def local_extract(prescription_text):
+    """
+    Run the rule-based parsers and decide whether their result can be trusted
+    without the LLM.
+
+    Returns (prescription, timing_status, confident). `confident` is True only
+    when medicine (one the formulary lists), duration, timing and food timing
+    were all found and nothing in the text is outside what the lexer
+    understands (e.g. "every 6 hours", "SOS") or contradicts itself (3 times
+    a day but only two slots named).
+    """
+    prescription = new_prescription(prescription_text)
+    tokens = lex(prescription_text)
+    
+    if tokens["medicine"]:
+        prescription["Medicine Name"] = canonical_medicine_name(tokens["medicine"])
+    
+    duration_num, duration_unit = tokens["duration"]
+    if duration_num and duration_unit:
+        prescription["Duration"] = str(duration_num)
+        prescription["Duration Unit"] = duration_unit
+    
+    timings, times_per_day, timing_status = timings_from_lex(tokens)
+    prescription["Morning"] = "yes" if timings['morning'] else "no"
+    prescription["Afternoon"] = "yes" if timings['afternoon'] else "no"
+    prescription["Night"] = "yes" if timings['night'] else "no"
+    prescription["Times Per Day"] = times_per_day
+    
+    if tokens["food_timing"]:
+        prescription["Food Timing"] = tokens["food_timing"]
+    
+    # Confidence checks
+    medicine = prescription["Medicine Name"]
+    medicine_ok = (
+        medicine != "Not specified"
+        and len(medicine.split()) <= 3
+        and is_known_medicine(tokens["medicine"])
+    )
+    
+    named_slots = sum(1 for value in tokens["slots"].values() if value)
+    timing_ok = named_slots > 0 or tokens["times_per_day"] is not None
+    if named_slots and named_slots != times_per_day:
+        timing_ok = False
+    
+    confident = (
+        medicine_ok
+        and prescription["Duration"] != "-"
+        and timing_ok
+        and prescription["Food Timing"] != "-"
+        and not tokens["ambiguous"]
+    )
+    
+    fill_total_tablets(prescription)
+    return prescription, timing_status, confident
+
+def extract_prescriptions(prescription_texts, llm_batch_fn=None):
+    """
+    Extract many prescriptions at once. Every text goes through the
+    rule-based path; only the ones that are not confident are handed to
+    `llm_batch_fn` (e.g. extract_batch_with_groq) together, in one call.
+
+    Returns a list of (prescription, timing_status) aligned with the input.
+    """
+    extracted = [local_extract(text) for text in prescription_texts]
+    
+    unsure = [i for i, (_, _, confident) in enumerate(extracted) if not confident]
+    if unsure and llm_batch_fn is not None:
+        try:
+            responses = llm_batch_fn([prescription_texts[i] for i in unsure])
+        except Exception as e:
+            print(f"GROQ API error: {str(e)}")
+            responses = [None] * len(unsure)
+        for i, response in zip(unsure, responses):
+            apply_groq_response(extracted[i][0], response)
+    
+    return [(prescription, timing_status) for prescription, timing_status, _ in extracted]
+
+def missing_fields(prescription, timing_status):
+    """Required fields that are still unresolved, as prompts for the doctor"""
+    missing = []
+    if prescription["Medicine Name"] == "Not specified":
+        missing.append("Medicine Name")
+    if prescription["Duration"] == "-":
+        missing.append("Duration (e.g., '3 days', '2 weeks')")
+    
+    # Check if timing is needed
+    if timing_status == "timing_needed":
+        missing.append("Timing (morning/afternoon/night)")
+    
+    # Check if food timing is needed
+    if prescription["Food Timing"] == "-":
+        missing.append("Food Timing (before food/after food)")
+    return missing
+
+def apply_groq_response(prescription, extraction):
+    """
+    Overwrite locally parsed fields with what GROQ found. `extraction` is a
+    validated dict from extract_with_groq; fields it left null keep the
+    local value, and the slots are only replaced when GROQ named at least one.
+    Strength is not taken over: the saved row has no column for it.
+    """
+    if not extraction:
+        return prescription
+    
+    if extraction["medicine"]:
+        prescription["Medicine Name"] = canonical_medicine_name(extraction["medicine"])
+    if extraction["duration"] and extraction["duration_unit"]:
+        prescription["Duration"] = str(extraction["duration"])
+        prescription["Duration Unit"] = extraction["duration_unit"]
+    if extraction["times_per_day"]:
+        prescription["Times Per Day"] = extraction["times_per_day"]
+    if extraction["morning"] or extraction["afternoon"] or extraction["night"]:
+        prescription["Morning"] = "yes" if extraction["morning"] else "no"
+        prescription["Afternoon"] = "yes" if extraction["afternoon"] else "no"
+        prescription["Night"] = "yes" if extraction["night"] else "no"
+    if extraction["food_timing"]:
+        prescription["Food Timing"] = extraction["food_timing"]
+    
+    fill_total_tablets(prescription)
+    return prescription
+
+def fill_total_tablets(prescription):
+    """Recalculate Total Tablets from the prescription's duration and frequency"""
+    if prescription["Duration"] != "-" and prescription["Duration Unit"] != "-":
+        try:
+            duration_num = int(prescription["Duration"])
+            timings_dict = {
+                'morning': prescription["Morning"] == "yes",
+                'afternoon': prescription["Afternoon"] == "yes",
+                'night': prescription["Night"] == "yes"
+            }
+            prescription["Total Tablets"] = calculate_total_tablets(
+                duration_num, prescription["Duration Unit"], timings_dict, prescription["Times Per Day"]
+            )
+        except:
+            prescription["Total Tablets"] = 0
+    return prescription
+
+def medicine_note(medicine):
+    """Confirmation-card note for a medicine the formulary does not list"""
+    if not medicine or medicine in ("-", "Not specified") or is_known_medicine(medicine):
+        return ""
+    suggestion = get_formulary().closest(medicine)
+    if suggestion and suggestion != medicine:
+        return f" (not in formulary - did you mean {suggestion}?)"
+    return " (not in formulary)"
+
+def format_duration(num, unit):
+    """Formats duration with correct singular/plural"""
+    if str(num) == "1" and unit.endswith('s'):
+        unit = unit[:-1]
+    return f"{num} {unit}"
+
+def format_timing(prescription):
+    """Join the selected timings into a display string"""
+    timing_str = []
+    if prescription["Morning"] == "yes":
+        timing_str.append("Morning")
+    if prescription["Afternoon"] == "yes":
+        timing_str.append("Afternoon")
+    if prescription["Night"] == "yes":
+        timing_str.append("Night")
+    return ', '.join(timing_str)
+
+def prescription_to_row(prescription, patient_name, today):
+    """Build the Google Sheets row for a confirmed prescription"""
+    return [
+        patient_name or "Unknown",
+        today,
+        prescription["Medicine Name"] or "Not specified",
+        format_duration(prescription["Duration"], prescription["Duration Unit"]),
+        prescription["Duration Unit"] or "-",
+        format_timing(prescription) or '-',
+        prescription["Food Timing"] or "-",
+        str(prescription["Times Per Day"]) or "1",
+        str(prescription["Total Tablets"]) or "0",
+        prescription["Raw Prescription"] or ""
+    ]
@@ -0,0 +1,204 @@
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import groq_api
+from llm_cache import ExtractionCache
+from prescription_lexer import lex
+from prompts import get_prompt
+from resilience import CircuitBreaker
+
+
+class ExtractionBackend:
+    """
+    Interface for the model that refines prescriptions the rule-based
+    parsers are not confident about.
+
+    extract() returns a dict validated against groq_api.EXTRACTION_SCHEMA,
+    or None when nothing could be extracted; extract_batch() returns such
+    results aligned with its input. Backends never raise for a failed
+    extraction so callers can keep the local parse.
+    """
+
+    name = "base"
+
+    def extract(self, prescription_text):
+        return self.extract_batch([prescription_text])[0]
+
+    def extract_batch(self, prescription_texts):
+        return [self.extract(text) for text in prescription_texts]
+
+    def stats(self):
+        """Cache / circuit figures for /admin/metrics"""
+        return {}
+
+
+class GroqBackend(ExtractionBackend):
+    """Hosted GROQ model (hedged, circuit-broken and cached in groq_api)"""
+
+    name = "groq"
+
+    def extract(self, prescription_text):
+        return groq_api.extract_with_groq(prescription_text)
+
+    def extract_batch(self, prescription_texts):
+        return groq_api.extract_batch_with_groq(prescription_texts)
+
+    def stats(self):
+        return {
+            "llm_cache": groq_api.extraction_cache.stats(),
+            "llm_prompt_version": groq_api.extraction_prompt.version,
+            "llm_circuit": {
+                "state": groq_api.groq_breaker.state,
+                "consecutive_failures": groq_api.groq_breaker.failures,
+                "p95_latency": groq_api.groq_latency.percentile(95),
+                "batch_p95_latency": groq_api.groq_batch_latency.percentile(95)
+            }
+        }
+
+
+class RulesBackend(ExtractionBackend):
+    """
+    The lexer alone, in the extraction schema. Makes no network calls, so
+    selecting it runs the whole app offline.
+    """
+
+    name = "rules"
+
+    def extract(self, prescription_text):
+        tokens = lex(prescription_text)
+        duration_num, duration_unit = tokens["duration"]
+        if not (tokens["medicine"] or duration_num or tokens["times_per_day"]):
+            return None
+        return {
+            "medicine": tokens["medicine"],
+            "strength": None,
+            "duration": duration_num,
+            "duration_unit": duration_unit,
+            "morning": tokens["slots"]["morning"],
+            "afternoon": tokens["slots"]["afternoon"],
+            "night": tokens["slots"]["night"],
+            "times_per_day": tokens["times_per_day"],
+            "food_timing": tokens["food_timing"]
+        }
+
+
+class LocalModelBackend(ExtractionBackend):
+    """
+    A model served on this host or LAN behind an OpenAI-compatible
+    /v1/chat/completions endpoint (llama.cpp `llama-server`, vLLM, Ollama).
+
+    Uses the same versioned prompts and schema validation as GROQ. Batches
+    are sent as `parallel` concurrent requests; with llama-server started
+    with `--parallel N --cont-batching` they are decoded together in one
+    batch, so throughput follows the host's cores instead of an API rate
+    limit.
+    """
+
+    name = "local"
+
+    def __init__(self, url, model, timeout=10.0, parallel=4, cache=None, prompt=None, usage_meter=None):
+        self.url = url.rstrip("/") + "/v1/chat/completions"
+        self.model = model
+        self.timeout = timeout
+        self.parallel = parallel
+        self.prompt = prompt or get_prompt()
+        self.cache = cache
+        self.usage_meter = usage_meter
+
+        self.breaker = CircuitBreaker()
+        self._executor = ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="local-llm")
+
+    def extract(self, prescription_text):
+        if self.cache is not None:
+            cached = self.cache.get(prescription_text)
+            if cached is not None:
+                return cached
+
+        result = self._complete(prescription_text)
+        if result is not None and self.cache is not None:
+            self.cache.set(prescription_text, result)
+        return result
+
+    def extract_batch(self, prescription_texts):
+        return list(self._executor.map(self.extract, prescription_texts))
+
+    def stats(self):
+        return {
+            "llm_cache": self.cache.stats() if self.cache is not None else None,
+            "llm_prompt_version": self.prompt.version,
+            "llm_circuit": {
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.failures
+            }
+        }
+
+    def _complete(self, prescription_text):
+        if not self.breaker.allow():
+            return None
+
+        body = json.dumps({
+            "model": self.model,
+            "messages": [{"role": "user", "content": self.prompt.render(prescription_text)}],
+            "temperature": 0.1,
+            "max_tokens": self.prompt.max_tokens,
+            "response_format": {"type": "json_object"}
+        }).encode()
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+
+        start = time.time()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                payload = json.loads(response.read())
+            content = payload["choices"][0]["message"]["content"]
+        except (urllib.error.URLError, OSError, ValueError, KeyError, IndexError) as e:
+            self.breaker.record_failure()
+            self._record_usage({}, time.time() - start, ok=False)
+            print(f"Local model error: {str(e)}")
+            return None
+
+        self.breaker.record_success()
+        self._record_usage(payload.get("usage") or {}, time.time() - start)
+        try:
+            return groq_api.parse_extraction(content)
+        except groq_api.ExtractionError as e:
+            print(f"Rejected local model extraction: {str(e)}")
+            return None
+
+    def _record_usage(self, usage, seconds, ok=True):
+        if self.usage_meter is not None:
+            self.usage_meter.record(
+                self.model, self.prompt.version,
+                usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), seconds, ok=ok
+            )
+
+
+def make_extraction_backend(name=None):
+    """Build the backend selected by EXTRACTION_BACKEND ('groq', 'local' or 'rules')"""
+    name = (name or os.getenv("EXTRACTION_BACKEND", "groq")).lower()
+    if name == "groq":
+        return GroqBackend()
+    if name == "rules":
+        return RulesBackend()
+    if name == "local":
+        model = os.getenv("LOCAL_LLM_MODEL", "local")
+        prompt = get_prompt()
+        return LocalModelBackend(
+            url=os.getenv("LOCAL_LLM_URL", "http://127.0.0.1:8080"),
+            model=model,
+            timeout=float(os.getenv("LOCAL_LLM_TIMEOUT", "10")),
+            parallel=int(os.getenv("LOCAL_LLM_PARALLEL", str(os.cpu_count() or 4))),
+            cache=ExtractionCache(
+                max_size=int(os.getenv("GROQ_CACHE_SIZE", "1024")),
+                ttl=int(os.getenv("GROQ_CACHE_TTL", str(7 * 24 * 3600))),
+                path=os.getenv("GROQ_CACHE_PATH") or None,
+                max_disk_rows=int(os.getenv("GROQ_CACHE_DISK_SIZE", "50000")),
+                namespace=f"local:{model}:{prompt.version}"
+            ),
+            prompt=prompt,
+            usage_meter=groq_api.usage_meter
+        )
+    raise ValueError(f"Unknown EXTRACTION_BACKEND: {name}")
@@ -0,0 +1,138 @@
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+# Same day counts calculate_total_tablets uses
+UNIT_DAYS = {"days": 1, "weeks": 7, "months": 30}
+
+
+def parse_duration_days(duration, unit):
+    """'3 days', 'days' -> 3; '2 weeks', 'weeks' -> 14; None if unparseable"""
+    try:
+        number = int(str(duration).split()[0])
+    except (ValueError, IndexError):
+        return None
+    multiplier = UNIT_DAYS.get(str(unit).strip().lower())
+    if multiplier is None or number <= 0:
+        return None
+    return number * multiplier
+
+
+class DemandForecaster:
+    """
+    Daily tablet demand per medicine over a forward horizon.
+
+    Each stored prescription is reduced once, as it arrives (store
+    listener), to four integers: medicine code, first day, number of days
+    and tablets per day. A forecast is then pure NumPy: every prescription
+    overlapping the window adds +tablets on its first day and -tablets the
+    day after its last (one bincount over a flattened medicine x day grid),
+    and a cumulative sum along the days turns those steps into daily
+    demand. Cost is linear in prescriptions plus medicines x days.
+    """
+
+    def __init__(self, normalize=None):
+        self.normalize = normalize
+
+        self._lock = threading.Lock()
+        self._medicine_codes = {}
+        self._medicines = []
+        self._pending = ([], [], [], [])  # medicine, start, days, per_day
+        self._arrays = tuple(np.zeros(0, dtype=np.int64) for _ in range(4))
+        self.skipped = 0
+
+    def add_records(self, records):
+        with self._lock:
+            for record in records:
+                self._add(record)
+
+    def _add(self, record):
+        medicine = record.get('Medicine Name') or ''
+        days = parse_duration_days(record.get('Duration'), record.get('Duration Unit'))
+        try:
+            start = date.fromisoformat(str(record.get('Date'))).toordinal()
+            per_day = int(record.get('Times Per Day'))
+        except (TypeError, ValueError):
+            start = per_day = None
+        if not medicine or medicine == '-' or days is None or start is None or per_day is None or per_day <= 0:
+            self.skipped += 1
+            return
+
+        if self.normalize:
+            medicine = self.normalize(medicine)
+        code = self._medicine_codes.get(medicine)
+        if code is None:
+            code = self._medicine_codes[medicine] = len(self._medicines)
+            self._medicines.append(medicine)
+
+        for column, value in zip(self._pending, (code, start, days, per_day)):
+            column.append(value)
+
+    def _columns(self):
+        """Prescription columns as int64 arrays, folding in rows added since the last call"""
+        if self._pending[0]:
+            self._arrays = tuple(
+                np.concatenate([array, np.asarray(pending, dtype=np.int64)])
+                for array, pending in zip(self._arrays, self._pending)
+            )
+            for pending in self._pending:
+                pending.clear()
+        return self._arrays
+
+    def forecast(self, start, days):
+        """
+        (medicine names, demand matrix) for `days` days from `start`:
+        matrix[m, d] is the tablets of medicine m needed on start + d.
+        Only medicines with some demand in the window are returned.
+        """
+        with self._lock:
+            medicine, first_day, duration, per_day = self._columns()
+            names = list(self._medicines)
+
+        window_start = start.toordinal()
+        begin = np.clip(first_day - window_start, 0, days)
+        end = np.clip(first_day + duration - window_start, 0, days)
+        active = end > begin
+
+        medicine, begin, end, per_day = medicine[active], begin[active], end[active], per_day[active]
+        width = days + 1
+        size = len(names) * width
+        steps = (
+            np.bincount(medicine * width + begin, weights=per_day, minlength=size)
+            - np.bincount(medicine * width + end, weights=per_day, minlength=size)
+        )
+        demand = np.cumsum(steps.reshape(len(names), width)[:, :days], axis=1)
+
+        used = np.unique(medicine)
+        return [names[code] for code in used], demand[used].astype(np.int64)
+
+    def summary(self, start, days, medicine=None, limit=None):
+        """
+        JSON-ready forecast, medicines ordered by total demand; total_tablets
+        covers the medicines returned
+        """
+        names, demand = self.forecast(start, days)
+        totals = demand.sum(axis=1)
+        order = np.argsort(-totals, kind="stable")
+
+        medicines = []
+        for index in order:
+            if medicine and names[index] != medicine:
+                continue
+            medicines.append({
+                "name": names[index],
+                "total": int(totals[index]),
+                "peak": int(demand[index].max()),
+                "daily": demand[index].tolist()
+            })
+            if limit and len(medicines) >= limit:
+                break
+
+        return {
+            "start": start.isoformat(),
+            "end": (start + timedelta(days=days - 1)).isoformat(),
+            "days": days,
+            "total_tablets": sum(entry["total"] for entry in medicines),
+            "medicines": medicines
+        }
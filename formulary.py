@@ -0,0 +1,259 @@
+import csv
+import os
+import re
+import threading
+
+DEFAULT_FORMULARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "formulary.csv")
+
+# Strengths and dosage forms are not part of the name: "Dolo 650 tab" -> "dolo"
+STRENGTH_RE = re.compile(r'\b\d+(?:\.\d+)?\s*(?:mg|mcg|g|gm|ml|iu|%)?(?=\s|$)')
+FORM_RE = re.compile(r'\b(?:tab|tabs|tablet|tablets|cap|caps|capsule|capsules|syp|syrup|susp|suspension|'
+                     r'inj|injection|drops?|cream|ointment|gel|sachet)\b')
+NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+# Words that may follow a drug name without changing which drug it is
+# ("aspirin every 6 hours"); any other extra word ("amoxicillin clavulanate")
+# may name a second drug, so the name is not resolved
+FILLER_WORDS = frozenset({
+    'a', 'an', 'the', 'in', 'at', 'on', 'of', 'per', 'with', 'and', 'oral', 'orally', 'po',
+    'every', 'each', 'daily', 'hourly', 'alternate', 'weekly', 'dose', 'sos', 'prn', 'stat',
+    'as', 'when', 'if', 'needed', 'required', 'one', 'two', 'half'
+})
+
+
+def normalize_drug_name(name):
+    """Lowercase, drop strength/dosage form and collapse punctuation to single spaces"""
+    text = (name or "").lower()
+    text = FORM_RE.sub(' ', STRENGTH_RE.sub(' ', text))
+    return NON_ALNUM_RE.sub(' ', text).strip()
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance, or limit + 1 as soon as it must exceed `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class Trie:
+    """Character trie mapping keys to values, with longest-prefix and prefix listing"""
+
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+
+    def insert(self, key, value):
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+        if "" not in node:
+            self.size += 1
+        node[""] = value  # "" never collides with a single-character edge
+
+    def get(self, key, default=None):
+        node = self._node(key)
+        return node.get("", default) if node is not None else default
+
+    def longest_word_prefix(self, key):
+        """
+        (value, rest) for the longest stored key that is `key` itself or a
+        prefix of it ending on a word boundary, where `rest` is the unmatched
+        remainder ("aspirin every" -> (value, "every")); (None, key) if none
+        """
+        node = self.root
+        found = (None, key)
+        for i, char in enumerate(key):
+            if char == " " and "" in node:
+                found = (node[""], key[i + 1:])
+            node = node.get(char)
+            if node is None:
+                return found
+        return (node[""], "") if "" in node else found
+
+    def items_with_prefix(self, prefix):
+        """Yield (key, value) for every key starting with `prefix`"""
+        node = self._node(prefix)
+        if node is None:
+            return
+        stack = [(prefix, node)]
+        while stack:
+            key, node = stack.pop()
+            for char, child in node.items():
+                if char == "":
+                    yield key, child
+                else:
+                    stack.append((key + char, child))
+
+    def _node(self, key):
+        node = self.root
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node
+
+
+class BKTree:
+    """Burkhard-Keller tree over edit distance for fast "within k edits" lookups"""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, word):
+        if self.root is None:
+            self.root = (word, {})
+            return
+        node = self.root
+        while True:
+            distance = edit_distance(word, node[0], max(len(word), len(node[0])))
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (word, {})
+                return
+            node = child
+
+    def search(self, word, max_distance):
+        """(distance, word) pairs within max_distance, closest first"""
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            candidate, children = stack.pop()
+            # Exact distance is needed for the triangle-inequality pruning
+            distance = edit_distance(word, candidate, max(len(word), len(candidate)))
+            if distance <= max_distance:
+                found.append((distance, candidate))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(found)
+
+
+class Formulary:
+    """
+    Brand and generic drug names resolved to a canonical generic.
+
+    Exact names, and names followed only by filler words, are answered from
+    a trie; a name followed by another word is left unresolved, since it may
+    be a combination ("metformin glimepiride"). Common misspellings are
+    listed in the formulary like any brand. Names
+    that are merely close to an entry are never resolved to it, since a
+    close name is often a different drug (linagliptin / sitagliptin);
+    closest() only offers such an entry as a hint for the user to confirm.
+    Results are memoised, so repeated names cost a dict lookup.
+    """
+
+    def __init__(self, entries=(), cache_size=4096):
+        self.cache_size = cache_size
+
+        self._trie = Trie()
+        self._bktree = BKTree()
+        self._cache = {}
+        self._lock = threading.Lock()
+
+        for name, generic in entries:
+            self.add(name, generic)
+
+    def __len__(self):
+        return self._trie.size
+
+    def add(self, name, generic):
+        key = normalize_drug_name(name)
+        if not key:
+            return
+        self._trie.insert(key, generic)
+        self._bktree.add(key)
+        with self._lock:
+            self._cache.clear()
+
+    def resolve(self, name):
+        """Canonical generic for a listed brand, generic or misspelling, or None"""
+        key = normalize_drug_name(name)
+        if not key:
+            return None
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+
+        generic, rest = self._trie.longest_word_prefix(key)
+        if not FILLER_WORDS.issuperset(rest.split()):
+            generic = None
+        with self._lock:
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[key] = generic
+        return generic
+
+    def closest(self, name):
+        """
+        Generic of the entries within one edit (two for names of eight or
+        more letters) of the name, or else of its first word; None unless
+        they all name the same generic. Names shorter than four letters are
+        never matched.
+        """
+        key = normalize_drug_name(name)
+        # Try the whole text, then just the first word ("paracetmol for fever")
+        for candidate in dict.fromkeys([key, key.split(" ")[0]]):
+            if len(candidate) < 4:
+                continue
+            max_distance = 2 if len(candidate) >= 8 else 1
+            generics = {self._trie.get(match) for _, match in self._bktree.search(candidate, max_distance)}
+            if generics:
+                return generics.pop() if len(generics) == 1 else None
+        return None
+
+    def names_with_prefix(self, prefix):
+        """(normalised name, generic) pairs for every name starting with `prefix`"""
+        return list(self._trie.items_with_prefix(normalize_drug_name(prefix)))
+
+
+def load_formulary(path=None):
+    """Read a name,generic CSV (generics should also list themselves)"""
+    path = path or os.getenv("FORMULARY_PATH", DEFAULT_FORMULARY_PATH)
+    formulary = Formulary()
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            for record in csv.DictReader(f):
+                formulary.add(record["name"], record["generic"])
+    except OSError as e:
+        print(f"Formulary not loaded: {str(e)}")
+    return formulary
+
+
+_formulary = None
+_formulary_lock = threading.Lock()
+
+
+def get_formulary():
+    """Process-wide formulary, loaded on first use"""
+    global _formulary
+    if _formulary is None:
+        with _formulary_lock:
+            if _formulary is None:
+                _formulary = load_formulary()
+    return _formulary
+
+
+def is_known_medicine(medicine_name):
+    return get_formulary().resolve(medicine_name) is not None
+
+
+def canonical_medicine_name(medicine_name):
+    """Generic name for a known drug, otherwise the name title-cased"""
+    if not medicine_name or medicine_name in ("-", "Not specified"):
+        return medicine_name
+    return get_formulary().resolve(medicine_name) or medicine_name.strip().title()
@@ -1,74 +1,311 @@
-from groq import Groq
+import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import re
+from formulary import canonical_medicine_name
+from llm_cache import ExtractionCache
+from llm_usage import UsageMeter
+from prescription_lexer import lex
+from prompts import get_prompt
+from resilience import CircuitBreaker, LatencyTracker, hedged_call
 
 load_dotenv()
 
-# Initialize Groq client
-client = Groq(
-    api_key=os.getenv('GROQ_API_KEY'),
+# Hard per-call deadline so a slow upstream can never pin a worker
+GROQ_DEADLINE = float(os.getenv('GROQ_DEADLINE', '5.0'))
+
+# Created on first use, so importing this module (and running with another
+# extraction backend) needs neither the groq package nor GROQ_API_KEY
+_client = None
+_client_lock = threading.Lock()
+
+def groq_client():
+    """The shared Groq client (retries are handled by hedging, not the SDK)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from groq import Groq
+                _client = Groq(
+                    api_key=os.getenv('GROQ_API_KEY'),
+                    timeout=GROQ_DEADLINE,
+                    max_retries=0
+                )
+    return _client
+
+GROQ_MODEL = "llama3-8b-8192"
+
+# Versioned prompt from the registry in prompts.py (GROQ_PROMPT_VERSION)
+extraction_prompt = get_prompt()
+
+# Tokens and wall time of every completion, exported at /admin/metrics
+usage_meter = UsageMeter()
+
+# Hedge a second request once the first is slower than the recent p95
+# (or GROQ_HEDGE_AFTER seconds until there are enough samples)
+GROQ_HEDGE_AFTER = float(os.getenv('GROQ_HEDGE_AFTER', '2.0'))
+groq_executor = ThreadPoolExecutor(max_workers=int(os.getenv('GROQ_MAX_WORKERS', '8')), thread_name_prefix='groq')
+groq_latency = LatencyTracker()
+# Batch prompts are larger and not hedged; their latency is kept apart so
+# it does not inflate the single-message p95
+groq_batch_latency = LatencyTracker()
+
+# After repeated failures stop calling GROQ for a while and parse locally
+groq_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv('GROQ_BREAKER_THRESHOLD', '5')),
+    reset_timeout=float(os.getenv('GROQ_BREAKER_RESET', '30'))
 )
 
-def extract_with_groq(prescription_text):
+# Doctors repeat the same phrasings all day; identical text never needs a second call
+extraction_cache = ExtractionCache(
+    max_size=int(os.getenv('GROQ_CACHE_SIZE', '1024')),
+    ttl=int(os.getenv('GROQ_CACHE_TTL', str(7 * 24 * 3600))),
+    path=os.getenv('GROQ_CACHE_PATH') or None,
+    max_disk_rows=int(os.getenv('GROQ_CACHE_DISK_SIZE', '50000')),
+    namespace=f"{GROQ_MODEL}:{extraction_prompt.version}"
+)
+
+DURATION_UNITS = ("days", "weeks", "months")
+FOOD_TIMINGS = ("before food", "after food")
+
+class ExtractionError(ValueError):
+    """GROQ returned something that does not match the extraction schema"""
+
+# field -> (type, allowed values or None); every field may be null except the slots
+EXTRACTION_SCHEMA = {
+    "medicine": (str, None),
+    "strength": (str, None),
+    "duration": (int, None),
+    "duration_unit": (str, DURATION_UNITS),
+    "morning": (bool, None),
+    "afternoon": (bool, None),
+    "night": (bool, None),
+    "times_per_day": (int, None),
+    "food_timing": (str, FOOD_TIMINGS)
+}
+
+def validate_extraction(data):
     """
-    Extract prescription information using GROQ API
+    Check a decoded extraction against EXTRACTION_SCHEMA and return it with
+    every field present. Numeric strings are accepted for integer fields and
+    absent slots count as false; anything else that does not fit raises
+    ExtractionError.
     """
-    try:
-        prompt = f"""
-        Extract the following information from this medical prescription text: "{prescription_text}"
-        
-        Return ONLY in this exact format:
-        Medicine Name: [medicine name or not mentioned]
-        Duration: [number only, e.g., 3]
-        Duration Unit: [days/weeks/months or not mentioned]
-        Morning: [yes/no]
-        Afternoon: [yes/no]
-        Night: [yes/no]
-        Times Per Day: [number or not mentioned]
-        
-        Rules:
-        - For Medicine Name: Extract the actual medicine/drug name (e.g., paracetamol, aspirin, etc.)
-        - For Duration: Extract only the number (e.g., if "3 days" then return "3")
-        - For Duration Unit: Extract only the unit (days, weeks, months)
-        - For Morning/Afternoon/Night: Set to "yes" only if explicitly mentioned
-        - For Times Per Day: Extract frequency number if mentioned (e.g., "2 times a day" = 2)
-        - If timing is mentioned as "twice a day" or "2 times" without specific timing, set Times Per Day accordingly
-        - Common timing keywords: morning, afternoon, evening, night, breakfast, lunch, dinner, bedtime
-        - Be very specific about timing - only say "yes" if clearly mentioned
+    if not isinstance(data, dict):
+        raise ExtractionError(f"Expected a JSON object, got {type(data).__name__}")
+    
+    result = {}
+    for field, (kind, allowed) in EXTRACTION_SCHEMA.items():
+        value = data.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+            if value.lower() in ("", "null", "none", "not mentioned"):
+                value = None
         
-        Examples:
-        - "take paracetamol 2 times a day for 3 days" → Morning: no, Afternoon: no, Night: no, Times Per Day: 2
-        - "take aspirin in the morning and night for 1 week" → Morning: yes, Afternoon: no, Night: yes, Times Per Day: 2
-        - "paracetamol for 5 days morning and evening" → Morning: yes, Afternoon: no, Night: yes, Times Per Day: 2
-        """
+        if value is None:
+            result[field] = False if kind is bool else None
+            continue
         
-        chat_completion = client.chat.completions.create(
+        if kind is int and isinstance(value, str) and value.isdigit():
+            value = int(value)
+        if kind is str and isinstance(value, str) and allowed:
+            value = value.lower()
+        if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+            raise ExtractionError(f"{field}: expected {kind.__name__}, got {value!r}")
+        if kind is int and value <= 0:
+            raise ExtractionError(f"{field}: must be positive, got {value}")
+        if allowed and value not in allowed:
+            raise ExtractionError(f"{field}: expected one of {allowed}, got {value!r}")
+        result[field] = value
+    
+    if result["medicine"] is None and result["duration"] is None and result["times_per_day"] is None:
+        raise ExtractionError("No prescription fields extracted")
+    return result
+
+def parse_extraction(response):
+    """Decode and validate one JSON-mode completion"""
+    try:
+        data = json.loads(response)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise ExtractionError(f"Invalid JSON: {str(e)}")
+    return validate_extraction(data)
+
+def extract_with_groq(prescription_text):
+    """
+    Extract prescription information using GROQ API, served from the
+    extraction cache when the same (normalised) text was seen before.
+
+    Returns a dict validated against EXTRACTION_SCHEMA, or None.
+    """
+    cached = extraction_cache.get(prescription_text)
+    if cached is not None:
+        return cached
+    
+    response = _call_groq(prescription_text)
+    if response is not None:
+        extraction_cache.set(prescription_text, response)
+    return response
+
+def extract_batch_with_groq(prescription_texts):
+    """
+    Extract several prescriptions with a single GROQ call.
+
+    Cached texts are answered locally and only the rest go into one numbered
+    prompt. Returns a list aligned with the input holding the validated
+    extraction dict for each text, or None where extraction failed.
+    """
+    results = [extraction_cache.get(text) for text in prescription_texts]
+    pending = [i for i, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+    
+    if len(pending) == 1:
+        results[pending[0]] = _call_groq(prescription_texts[pending[0]])
+    else:
+        prompt = build_batch_prompt([prescription_texts[i] for i in pending])
+        response = _guarded_completion(
+            prompt, max_tokens=extraction_prompt.max_tokens * len(pending), deadline=GROQ_DEADLINE * 2,
+            hedge=False, latency=groq_batch_latency
+        )
+        items = split_batch_response(response)
+        for number, i in enumerate(pending, 1):
+            results[i] = _validated(items.get(number))
+    
+    for i in pending:
+        if results[i] is not None:
+            extraction_cache.set(prescription_texts[i], results[i])
+    return results
+
+def split_batch_response(response):
+    """
+    Map each item of a batch response ({"items": [{"n": 1, ...}, ...]}) to
+    its number, re-encoded so every item is validated on its own
+    """
+    items = {}
+    try:
+        data = json.loads(response) if response else {}
+    except json.JSONDecodeError as e:
+        print(f"GROQ batch response is not valid JSON: {str(e)}")
+        return items
+    
+    entries = data.get("items") if isinstance(data, dict) else None
+    for position, entry in enumerate(entries if isinstance(entries, list) else [], 1):
+        if not isinstance(entry, dict):
+            continue
+        number = entry.get("n", position)
+        if isinstance(number, str) and number.isdigit():
+            number = int(number)
+        items[number] = json.dumps(entry)
+    return items
+
+def _call_groq(prescription_text):
+    """
+    Make the GROQ API call for one prescription
+    """
+    return _validated(_guarded_completion(build_extraction_prompt(prescription_text), extraction_prompt.max_tokens))
+
+def _guarded_completion(prompt, max_tokens, deadline=GROQ_DEADLINE, hedge=True, latency=groq_latency):
+    """
+    Run a completion with a strict deadline, an optional hedged retry and the
+    circuit breaker. Returns None when the call fails or the circuit is open
+    so callers fall back to local parsing.
+    """
+    if not groq_breaker.allow():
+        print("GROQ circuit open, skipping API call")
+        return None
+    
+    hedge_after = (latency.percentile(95) or GROQ_HEDGE_AFTER) if hedge else None
+    
+    try:
+        response = hedged_call(
+            groq_executor,
+            lambda: _request_completion(prompt, max_tokens, timeout=deadline, latency=latency),
+            deadline, hedge_after
+        )
+        groq_breaker.record_success()
+        return response
+    except Exception as e:
+        groq_breaker.record_failure()
+        print(f"GROQ API error: {str(e)}")
+        return None
+
+def _validated(response):
+    """Parsed extraction, or None (logged) when the response is missing or malformed"""
+    if not response:
+        return None
+    try:
+        return parse_extraction(response)
+    except ExtractionError as e:
+        print(f"Rejected GROQ extraction: {str(e)}")
+        return None
+
+def _request_completion(prompt, max_tokens, prompt_version=None, timeout=GROQ_DEADLINE, latency=groq_latency):
+    """
+    Single blocking JSON-mode chat completion request; raises on any failure.
+    Token usage and wall time are recorded in usage_meter either way.
+    `timeout` overrides the client's default for this request.
+    """
+    prompt_version = prompt_version or extraction_prompt.version
+    start = time.time()
+    try:
+        chat_completion = groq_client().chat.completions.create(
             messages=[
                 {
                     "role": "user",
                     "content": prompt
                 }
             ],
-            model="llama3-8b-8192",
+            model=GROQ_MODEL,
             temperature=0.1,
-            max_tokens=200
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"},
+            timeout=timeout
         )
-        
-        response = chat_completion.choices[0].message.content
-        
-        # Clean up the response
-        response = response.strip()
-        
-        # Validate response format
-        if not response or len(response.split('\n')) < 4:
-            return None
-            
-        return response
-        
-    except Exception as e:
-        print(f"GROQ API error: {str(e)}")
-        return None
+    except Exception:
+        usage_meter.record(GROQ_MODEL, prompt_version, 0, 0, time.time() - start, ok=False)
+        raise
+    
+    elapsed = time.time() - start
+    latency.record(elapsed)
+    usage = chat_completion.usage
+    usage_meter.record(
+        GROQ_MODEL, prompt_version,
+        usage.prompt_tokens if usage else 0,
+        usage.completion_tokens if usage else 0,
+        elapsed
+    )
+    return chat_completion.choices[0].message.content
+
+def build_extraction_prompt(prescription_text):
+    """
+    Prompt asking GROQ for one JSON extraction object
+    """
+    return extraction_prompt.render(prescription_text)
+
+def build_batch_prompt(prescription_texts):
+    """
+    Prompt asking GROQ to extract several numbered prescriptions at once
+    """
+    return extraction_prompt.render_batch(prescription_texts)
+
+def extraction_to_fields(extraction):
+    """Display form of an extraction, with the same keys manual_prescription_parse returns"""
+    def text(value):
+        return "not mentioned" if value is None else str(value)
+    
+    return {
+        "Medicine Name": text(extraction["medicine"]),
+        "Strength": text(extraction["strength"]),
+        "Duration": text(extraction["duration"]),
+        "Duration Unit": text(extraction["duration_unit"]),
+        "Morning": "yes" if extraction["morning"] else "no",
+        "Afternoon": "yes" if extraction["afternoon"] else "no",
+        "Night": "yes" if extraction["night"] else "no",
+        "Times Per Day": text(extraction["times_per_day"]),
+        "Food Timing": text(extraction["food_timing"])
+    }
 
 def parse_prescription_smart(prescription_text):
     """
@@ -79,13 +316,7 @@ def parse_prescription_smart(prescription_text):
         groq_result = extract_with_groq(prescription_text)
         
         if groq_result:
-            parsed_data = {}
-            for line in groq_result.split('\n'):
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    parsed_data[key.strip()] = value.strip()
-            
-            return parsed_data
+            return extraction_to_fields(groq_result)
         
         # Fallback to manual parsing
         return manual_prescription_parse(prescription_text)
@@ -98,85 +329,32 @@ def manual_prescription_parse(prescription_text):
     """
     Manual parsing as fallback when GROQ fails
     """
-    prescription_text = prescription_text.lower()
+    tokens = lex(prescription_text)
     
     result = {
-        "Medicine Name": "not mentioned",
+        "Medicine Name": tokens["medicine"] or "not mentioned",
+        "Strength": "not mentioned",
         "Duration": "not mentioned",
         "Duration Unit": "not mentioned",
-        "Morning": "no",
-        "Afternoon": "no",
-        "Night": "no",
-        "Times Per Day": "not mentioned"
+        "Morning": "yes" if tokens["slots"]["morning"] else "no",
+        "Afternoon": "yes" if tokens["slots"]["afternoon"] else "no",
+        "Night": "yes" if tokens["slots"]["night"] else "no",
+        "Times Per Day": "not mentioned",
+        "Food Timing": tokens["food_timing"] or "not mentioned"
     }
     
-    # Extract medicine name
-    medicine_patterns = [
-        r'take\s+(?:the\s+)?([a-zA-Z]+)',
-        r'([a-zA-Z]+)\s+for',
-        r'([a-zA-Z]+)\s+\d+\s*times',
-        r'([a-zA-Z]+)\s+tablet'
-    ]
-    
-    for pattern in medicine_patterns:
-        match = re.search(pattern, prescription_text)
-        if match:
-            medicine = match.group(1).strip()
-            if medicine not in ['the', 'for', 'take', 'tablet', 'times', 'day']:
-                result["Medicine Name"] = medicine.title()
-                break
-    
-    # Extract duration
-    duration_patterns = [
-        r'for\s+(\d+)\s+(day|days|week|weeks|month|months)',
-        r'(\d+)\s+(day|days|week|weeks|month|months)',
-        r'for\s+(\d+)\s*d\b',
-        r'(\d+)\s*d\b'
-    ]
-    
-    for pattern in duration_patterns:
-        match = re.search(pattern, prescription_text)
-        if match:
-            result["Duration"] = match.group(1)
-            if len(match.groups()) > 1:
-                unit = match.group(2)
-                if unit in ['day', 'days', 'd']:
-                    result["Duration Unit"] = 'days'
-                elif unit in ['week', 'weeks', 'w']:
-                    result["Duration Unit"] = 'weeks'
-                elif unit in ['month', 'months', 'm']:
-                    result["Duration Unit"] = 'months'
-            break
+    duration_num, duration_unit = tokens["duration"]
+    if duration_num is not None:
+        result["Duration"] = str(duration_num)
+        result["Duration Unit"] = duration_unit
     
-    # Extract timing
-    if any(word in prescription_text for word in ['morning', 'morn', 'breakfast', 'am']):
-        result["Morning"] = "yes"
-    if any(word in prescription_text for word in ['afternoon', 'lunch', 'noon']):
-        result["Afternoon"] = "yes"
-    if any(word in prescription_text for word in ['night', 'evening', 'dinner', 'bedtime', 'sleep']):
-        result["Night"] = "yes"
-    
-    # Extract frequency
-    frequency_patterns = [
-        r'(\d+)\s*times?\s*a?\s*day',
-        r'(\d+)\s*times?\s*daily',
-        r'(\d+)x\s*day',
-        r'(\d+)/day'
-    ]
-    
-    for pattern in frequency_patterns:
-        match = re.search(pattern, prescription_text)
-        if match:
-            result["Times Per Day"] = match.group(1)
-            break
-    
-    # Smart frequency detection
-    timing_count = sum(1 for key in ['Morning', 'Afternoon', 'Night'] if result[key] == 'yes')
-    if timing_count > 0 and result["Times Per Day"] == "not mentioned":
-        result["Times Per Day"] = str(timing_count)
-    elif result["Times Per Day"] != "not mentioned" and timing_count == 0:
-        # If frequency is specified but no timing, we need to ask for timing
-        pass
+    if tokens["times_per_day"] is not None:
+        result["Times Per Day"] = str(tokens["times_per_day"])
+    else:
+        # Smart frequency detection: one dose per named timing
+        timing_count = sum(1 for key in ['Morning', 'Afternoon', 'Night'] if result[key] == 'yes')
+        if timing_count > 0:
+            result["Times Per Day"] = str(timing_count)
     
     return result
 
@@ -206,9 +384,8 @@ def test_prescription_parsing():
         groq_result = extract_with_groq(test_case)
         if groq_result:
             print("GROQ Result:")
-            for line in groq_result.split('\n'):
-                if line.strip():
-                    print(f"  {line}")
+            for key, value in groq_result.items():
+                print(f"  {key}: {value}")
         else:
             print("GROQ Result: Failed")
         
@@ -223,24 +400,10 @@ def test_prescription_parsing():
 # Additional utility functions for enhanced parsing
 def normalize_medicine_name(medicine_name):
     """
-    Normalize medicine names for consistency
+    Normalize medicine names for consistency: brands and misspellings
+    resolve to the generic through the formulary (data/formulary.csv)
     """
-    # Common medicine name corrections
-    corrections = {
-        'paracetamol': 'Paracetamol',
-        'aspirin': 'Aspirin',
-        'ibuprofen': 'Ibuprofen',
-        'amoxicillin': 'Amoxicillin',
-        'omeprazole': 'Omeprazole',
-        'metformin': 'Metformin',
-        'atorvastatin': 'Atorvastatin',
-        'lisinopril': 'Lisinopril',
-        'amlodipine': 'Amlodipine',
-        'simvastatin': 'Simvastatin'
-    }
-    
-    medicine_lower = medicine_name.lower()
-    return corrections.get(medicine_lower, medicine_name.title())
+    return canonical_medicine_name(medicine_name)
 
 def validate_prescription_data(prescription_data):
     """
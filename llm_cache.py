@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_prescription_text(text):
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    text = re.sub(r'\s+', ' ', text.strip().lower())
+    return text.strip(' .,;!')
+
+
+class ExtractionCache:
+    """
+    Cache of LLM extraction results keyed on normalised prescription text.
+
+    A bounded in-memory LRU sits in front of an optional SQLite file, so
+    workers on the same host share results: a phrasing extracted by one
+    gunicorn worker is a disk hit for the others. Entries expire after `ttl`
+    seconds. The file is bounded too: expired rows are purged when it is
+    opened and on every write, and beyond `max_disk_rows` the rows closest
+    to expiry (the oldest, as all share one ttl) are evicted. Hit/miss
+    counters are exposed through stats().
+    """
+
+    def __init__(self, max_size=1024, ttl=7 * 24 * 3600, path=None, namespace="", max_disk_rows=50000):
+        self.max_size = max_size
+        self.max_disk_rows = max_disk_rows
+        self.ttl = ttl
+        self.path = path
+        self.namespace = namespace
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._conn = None
+        self._pid = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, text):
+        normalized = normalize_prescription_text(text)
+        return hashlib.sha1(f"{self.namespace}:{normalized}".encode()).hexdigest()
+
+    def _disk(self):
+        if not self.path:
+            return None
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_extraction_cache_expires ON extraction_cache (expires)")
+            self._prune(self._conn)
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def _prune(self, disk):
+        """Delete expired rows, then the oldest rows beyond max_disk_rows"""
+        disk.execute("DELETE FROM extraction_cache WHERE expires <= ?", (time.time(),))
+        excess = disk.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0] - self.max_disk_rows
+        if excess > 0:
+            disk.execute(
+                "DELETE FROM extraction_cache WHERE key IN "
+                "(SELECT key FROM extraction_cache ORDER BY expires LIMIT ?)",
+                (excess,)
+            )
+
+    def get(self, text):
+        key = self.key(text)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+
+            try:
+                disk = self._disk()
+                row = disk.execute(
+                    "SELECT value, expires FROM extraction_cache WHERE key = ?", (key,)
+                ).fetchone() if disk else None
+            except sqlite3.Error as e:
+                print(f"Extraction cache read error: {str(e)}")
+                row = None
+
+            if row and row[1] > now:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                self.disk_hits += 1
+                return value
+
+            self.misses += 1
+            return None
+
+    def set(self, text, value):
+        key = self.key(text)
+        expires = time.time() + self.ttl
+
+        with self._lock:
+            self._remember(key, value, expires)
+            try:
+                disk = self._disk()
+                if disk:
+                    disk.execute(
+                        "INSERT OR REPLACE INTO extraction_cache (key, value, expires) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), expires)
+                    )
+                    self._prune(disk)
+                    disk.commit()
+            except sqlite3.Error as e:
+                print(f"Extraction cache write error: {str(e)}")
+
+    def _remember(self, key, value, expires):
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            disk = self._disk()
+            if disk:
+                disk.execute("DELETE FROM extraction_cache")
+                disk.commit()
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,57 @@
+import threading
+
+from resilience import LatencyTracker
+
+
+class UsageMeter:
+    """
+    Per-call token and latency accounting for LLM requests, grouped by
+    model and prompt version. Counters are cumulative for the process;
+    latency percentiles cover the last `window` calls of each group.
+    """
+
+    def __init__(self, window=500):
+        self.window = window
+
+        self._lock = threading.Lock()
+        self._groups = {}
+
+    def record(self, model, prompt_version, prompt_tokens, completion_tokens, seconds, ok=True):
+        key = f"{model}/{prompt_version}"
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = {
+                    "model": model,
+                    "prompt_version": prompt_version,
+                    "calls": 0,
+                    "errors": 0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "latency": LatencyTracker(window=self.window, min_samples=1)
+                }
+            group["calls"] += 1
+            if not ok:
+                group["errors"] += 1
+            group["prompt_tokens"] += prompt_tokens or 0
+            group["completion_tokens"] += completion_tokens or 0
+        group["latency"].record(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            groups = [dict(group) for group in self._groups.values()]
+
+        summary = {"calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "by_prompt": {}}
+        for group in groups:
+            latency = group.pop("latency")
+            succeeded = group["calls"] - group["errors"]
+            for field in ("calls", "errors", "prompt_tokens", "completion_tokens"):
+                summary[field] += group[field]
+            summary["by_prompt"][f"{group['model']}/{group['prompt_version']}"] = {
+                **group,
+                "avg_prompt_tokens": round(group["prompt_tokens"] / succeeded, 1) if succeeded else None,
+                "avg_completion_tokens": round(group["completion_tokens"] / succeeded, 1) if succeeded else None,
+                "p50_latency": latency.percentile(50),
+                "p95_latency": latency.percentile(95)
+            }
+        return summary
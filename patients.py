@@ -0,0 +1,49 @@
+import bisect
+import re
+import threading
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_patient_name(name):
+    """'  ann   SMITH ' -> 'ann smith'"""
+    return WHITESPACE_RE.sub(' ', (name or '').strip().lower())
+
+
+class PatientIndex:
+    """
+    Normalised patient name -> (Date, store row id) of that patient's
+    prescriptions, oldest first.
+
+    Fed by a store listener, so it is built from history at startup and
+    extended on every save. Row ids alone do not follow dates (history
+    imported after the first saves gets later ids), so each list is kept
+    sorted by date; new saves are dated today and land at the end. A lookup is a dict access plus a slice; the
+    caller fetches the handful of rows it needs by primary key, so the cost
+    does not depend on how many prescriptions exist in total.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+
+    def add_records(self, records):
+        with self._lock:
+            for record in records:
+                key = normalize_patient_name(record.get('Patient Name'))
+                if key:
+                    bisect.insort(self._rows.setdefault(key, []), (record.get('Date') or "", record["_row"]))
+
+    def row_ids(self, patient_name, limit=None):
+        """Newest-first row ids for a patient (at most `limit`)"""
+        with self._lock:
+            rows = self._rows.get(normalize_patient_name(patient_name), [])
+            recent = rows[-limit:] if limit else rows
+            return [row_id for _, row_id in reversed(recent)]
+
+    def count(self, patient_name):
+        with self._lock:
+            return len(self._rows.get(normalize_patient_name(patient_name), []))
+
+    def __len__(self):
+        return len(self._rows)
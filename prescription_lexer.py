@@ -0,0 +1,111 @@
+import re
+
+# Every pattern the prescription parsers need, compiled once at import and
+# matched in a single left-to-right scan. Tokens only start at a word
+# boundary whose first character can begin some token, so most positions
+# are rejected before any alternative is tried. Alternatives are tried in
+# order, so longer phrases are listed before their substrings.
+TOKEN_RE = re.compile(r'''
+    \b(?=[\dabdehilmnopqstw])
+    (?:
+      (?P<duration>(?P<duration_num>\d+)\s*(?P<duration_unit>days?|weeks?|months?|d|w|m)\b)
+    | (?P<frequency>(?P<frequency_num>\d+)\s*(?:times?\s*(?:a\s*)?day|times?\s*daily|[x×]\s*day|/\s*day))
+    | (?P<frequency_word>\b(?:once|twice|thrice|od|bd|bid|tds|tid|qid)\b)
+    | (?P<before_food>before\s+(?:food|meal|eating)|empty\s+stomach)
+    | (?P<after_food>(?:after|with)\s+(?:food|meal)|after\s+eating)
+    | (?P<afternoon>afternoon|lunch|noon|\bpm\b)
+    | (?P<morning>morning|morn|breakfast|\bam\b)
+    | (?P<night>night|evening|dinner|bedtime|sleep|\bhs\b)
+    | (?P<ambiguous>\b(?:every|hourly|alternate|weekly|sos|prn|stat|(?:as|when|if)\s+(?:needed|required))\b)
+    )
+''', re.VERBOSE)
+
+PREFIX_RE = re.compile(r'^(take\s+(the\s+)?|have\s+)')
+
+MEDICINE_RES = [
+    re.compile(r'^([a-zA-Z][a-zA-Z\s]*?)\s+(?:\d+|tablet|twice|once|morning|afternoon|night|before|after|for)'),
+    re.compile(r'^([a-zA-Z][a-zA-Z\s]*?)\s+(?:\d+\s*times)'),
+    re.compile(r'^([a-zA-Z][a-zA-Z\s]*?)\s+(?:for\s+\d+)'),
+    re.compile(r'^([a-zA-Z][a-zA-Z\s]*?)(?:\s+\d+|\s+tablet|\s+twice|\s+once)')
+]
+NOT_MEDICINE = {'the', 'for', 'take', 'tablet', 'tablets', 'times', 'day', 'days', 'in', 'and', 'or', 'have'}
+TRAILING_FILLER_RE = re.compile(r'(?:\s+(?:in|the|at|on|with|and|of|a))+$')
+
+DURATION_UNITS = {
+    'day': 'days', 'days': 'days', 'd': 'days',
+    'week': 'weeks', 'weeks': 'weeks', 'w': 'weeks',
+    'month': 'months', 'months': 'months', 'm': 'months'
+}
+FREQUENCY_WORDS = {
+    'once': 1, 'od': 1,
+    'twice': 2, 'bd': 2, 'bid': 2,
+    'thrice': 3, 'tds': 3, 'tid': 3,
+    'qid': 4
+}
+SLOTS = ('morning', 'afternoon', 'night')
+
+
+def extract_medicine(text):
+    """Medicine name from the start of lowercased text, or None"""
+    text = PREFIX_RE.sub('', text)
+    for pattern in MEDICINE_RES:
+        match = pattern.search(text)
+        if match:
+            # "aspirin in the morning" -> "aspirin"
+            medicine_name = TRAILING_FILLER_RE.sub('', match.group(1).strip())
+            if medicine_name not in NOT_MEDICINE:
+                return medicine_name.title()
+    return None
+
+
+def lex(prescription_text):
+    """
+    Scan a prescription once and return everything the parsers extract:
+
+        medicine        title-cased name or None
+        duration        (number, 'days'|'weeks'|'months') or (None, None)
+        times_per_day   explicit frequency, or None if the text gives none
+        slots           {'morning': bool, 'afternoon': bool, 'night': bool}
+        food_timing     'before food', 'after food' or None
+        ambiguous       frequency wording the rules cannot resolve
+                        ("every 6 hours", "SOS", ...)
+    """
+    text = prescription_text.strip().lower()
+
+    result = {
+        "medicine": extract_medicine(text),
+        "duration": (None, None),
+        "times_per_day": None,
+        "slots": {slot: False for slot in SLOTS},
+        "food_timing": None,
+        "ambiguous": []
+    }
+    before_food = after_food = False
+
+    for match in TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == 'duration':
+            if result["duration"][0] is None:
+                result["duration"] = (int(match.group('duration_num')), DURATION_UNITS[match.group('duration_unit')])
+        elif kind == 'frequency':
+            if result["times_per_day"] is None:
+                result["times_per_day"] = int(match.group('frequency_num'))
+        elif kind == 'frequency_word':
+            if result["times_per_day"] is None:
+                result["times_per_day"] = FREQUENCY_WORDS[match.group(kind)]
+        elif kind == 'before_food':
+            before_food = True
+        elif kind == 'after_food':
+            after_food = True
+        elif kind == 'ambiguous':
+            result["ambiguous"].append(match.group(kind))
+        else:
+            result["slots"][kind] = True
+
+    # "before food" wins when both are mentioned
+    if before_food:
+        result["food_timing"] = "before food"
+    elif after_food:
+        result["food_timing"] = "after food"
+
+    return result
@@ -0,0 +1,126 @@
+import os
+
+# Keys and value rules shared by the compact templates. Must stay in sync
+# with groq_api.EXTRACTION_SCHEMA.
+EXTRACTION_FIELDS = (
+    'medicine (generic or brand name), strength (dose per unit, e.g. "500mg"), '
+    'duration (integer), duration_unit ("days"|"weeks"|"months"), '
+    'morning, afternoon, night (true only if that time is named; evening/dinner/bedtime = night), '
+    'times_per_day (integer, e.g. twice = 2), food_timing ("before food"|"after food"). '
+    'Use null for anything not stated.'
+)
+
+# Templates go through str.format, so literal braces are doubled
+MINIMAL_FIELDS = (
+    '{{medicine, strength, duration:int, duration_unit:days|weeks|months, '
+    'morning/afternoon/night:bool, times_per_day:int, food_timing:before food|after food}}, null if absent'
+)
+
+
+class PromptTemplate:
+    """
+    One versioned pair of extraction prompts: `single` is formatted with
+    {text}, `batch` with {numbered} (one '<n>. "<text>"' line per
+    prescription). `max_tokens` is the completion budget per prescription.
+    """
+
+    def __init__(self, version, single, batch, max_tokens):
+        self.version = version
+        self.single = single
+        self.batch = batch
+        self.max_tokens = max_tokens
+
+    def render(self, prescription_text):
+        return self.single.format(text=prescription_text)
+
+    def render_batch(self, prescription_texts):
+        numbered = "\n".join(f'{i}. "{text}"' for i, text in enumerate(prescription_texts, 1))
+        return self.batch.format(numbered=numbered)
+
+
+PROMPTS = {}
+
+
+def register_prompt(template):
+    PROMPTS[template.version] = template
+    return template
+
+
+# The original rules-and-examples prompt, kept (in JSON form) as the
+# accuracy baseline for benchmarks/bench_prompts.py
+register_prompt(PromptTemplate(
+    "v1",
+    single="""
+        Extract the following information from this medical prescription text: "{text}"
+
+        Return ONLY a JSON object with these keys:
+        "medicine": medicine name or null
+        "strength": dose per unit such as "500mg", or null
+        "duration": number only, e.g. 3, or null
+        "duration_unit": "days", "weeks", "months" or null
+        "morning": true/false
+        "afternoon": true/false
+        "night": true/false
+        "times_per_day": number or null
+        "food_timing": "before food", "after food" or null
+
+        Rules:
+        - For medicine: Extract the actual medicine/drug name (e.g., paracetamol, aspirin, etc.)
+        - For duration: Extract only the number (e.g., if "3 days" then return 3)
+        - For duration_unit: Extract only the unit (days, weeks, months)
+        - For morning/afternoon/night: Set to true only if explicitly mentioned
+        - For times_per_day: Extract frequency number if mentioned (e.g., "2 times a day" = 2)
+        - If timing is mentioned as "twice a day" or "2 times" without specific timing, set times_per_day accordingly
+        - Common timing keywords: morning, afternoon, evening, night, breakfast, lunch, dinner, bedtime
+        - Be very specific about timing - only say true if clearly mentioned
+
+        Examples:
+        - "take paracetamol 2 times a day for 3 days" → morning: false, afternoon: false, night: false, times_per_day: 2
+        - "take aspirin in the morning and night for 1 week" → morning: true, afternoon: false, night: true, times_per_day: 2
+        - "paracetamol for 5 days morning and evening" → morning: true, afternoon: false, night: true, times_per_day: 2
+        """,
+    batch="""
+        Extract the following information from each numbered medical prescription below.
+
+        {numbered}
+
+        Return ONLY a JSON object {{"items": [...]}} with one object per prescription, in order.
+        Each object has "n" (the prescription number) and these keys:
+        "medicine", "strength", "duration", "duration_unit", "morning", "afternoon", "night",
+        "times_per_day", "food_timing" (null when not mentioned)
+
+        Rules:
+        - For morning/afternoon/night: Set to true only if explicitly mentioned
+        - For times_per_day: Extract frequency number if mentioned (e.g., "2 times a day" or "twice a day" = 2)
+        - Common timing keywords: morning, afternoon, evening, night, breakfast, lunch, dinner, bedtime
+        """,
+    max_tokens=200
+))
+
+register_prompt(PromptTemplate(
+    "v2",
+    single=f'Extract this prescription as a JSON object with keys: {EXTRACTION_FIELDS}\nPrescription: "{{text}}"',
+    batch=(
+        f'Extract each numbered prescription. Reply with a JSON object {{{{"items": [...]}}}} holding, '
+        f'in order, one object per prescription with key n (its number) and keys: {EXTRACTION_FIELDS}\n'
+        '{numbered}'
+    ),
+    max_tokens=120
+))
+
+register_prompt(PromptTemplate(
+    "v3",
+    single=f'JSON {MINIMAL_FIELDS}. Rx: "{{text}}"',
+    batch=f'JSON {{{{"items": [{{{{n, ...}}}}]}}}}, one per Rx in order, each {MINIMAL_FIELDS}.\n{{numbered}}',
+    max_tokens=100
+))
+
+DEFAULT_PROMPT_VERSION = "v2"
+
+
+def get_prompt(version=None):
+    """Template for `version`, or the one selected by GROQ_PROMPT_VERSION"""
+    version = version or os.getenv("GROQ_PROMPT_VERSION", DEFAULT_PROMPT_VERSION)
+    if version not in PROMPTS:
+        raise ValueError(f"Unknown prompt version: {version} (known: {', '.join(PROMPTS)})")
+    return PROMPTS[version]
@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a dependency whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Classic three-state circuit breaker.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls fail fast for `reset_timeout` seconds. The first call after that is
+    let through as a trial (half-open): success closes the circuit, failure
+    opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """Return True if a call may go through right now"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                if self.opened_at is None:
+                    print(f"Circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.time()
+
+
+class LatencyTracker:
+    """Rolling window of call latencies used to pick the hedging delay"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+def hedged_call(executor, fn, deadline, hedge_after=None):
+    """
+    Run fn() on the executor and return the first successful result.
+
+    If the first attempt has not finished after `hedge_after` seconds a
+    second, identical attempt is started. Raises TimeoutError when nothing
+    succeeds within `deadline` seconds, or the last attempt's exception when
+    every attempt failed. Attempts still running are left to finish on the
+    pool (their own client timeout bounds them).
+    """
+    start = time.time()
+    futures = [executor.submit(fn)]
+
+    if hedge_after is not None and hedge_after < deadline:
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            futures.append(executor.submit(fn))
+
+    last_error = None
+    pending = set(futures)
+    while pending:
+        remaining = deadline - (time.time() - start)
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            error = future.exception()
+            if error is None:
+                return future.result()
+            last_error = error
+
+    if last_error is not None and not pending:
+        raise last_error
+    raise TimeoutError(f"No response within {deadline}s")
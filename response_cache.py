@@ -0,0 +1,110 @@
+import hashlib
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+from email.utils import formatdate
+
+from flask import request, make_response
+
+
+class ResponseCache:
+    """
+    Versioned response cache for read-only admin endpoints.
+
+    Every cached body is tagged with the data version it was computed from.
+    Anything that changes the data calls bump() (or invalidate()), which makes
+    every entry stale at once. Responses carry ETag / Last-Modified headers so
+    a dashboard that polls with If-None-Match gets a 304 without the view
+    running at all.
+
+    The ETag is derived from `state_fn()` (a token of the shared data that
+    every worker and restart agrees on, such as the store's newest row id),
+    today's date (views default their date windows to today) and the
+    request path, never from this process's counter. While `state_fn()`
+    returns None (this process's aggregates are still catching up) views
+    run uncached and untagged.
+    """
+
+    def __init__(self, ttl=60, max_entries=256, state_fn=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.state_fn = state_fn
+
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.version = 0
+        self.last_modified = time.time()
+
+    def bump(self, *args):
+        """Mark the data as changed. Accepts and ignores listener arguments."""
+        with self._lock:
+            self.version += 1
+            self.last_modified = time.time()
+
+    def invalidate(self):
+        """Drop every cached response and bump the version"""
+        with self._lock:
+            self._entries.clear()
+        self.bump()
+
+    def _etag(self, key, state):
+        return hashlib.sha1(f"{state}:{key}".encode()).hexdigest()
+
+    def _state(self):
+        """Durable data state plus the date, identical in every process; None if incomplete"""
+        data = self.state_fn() if self.state_fn is not None else self.version
+        if data is None:
+            return None
+        return f"{data}:{datetime.now().strftime('%Y-%m-%d')}"
+
+    def cached(self, before=None, ttl=None):
+        """
+        Decorator for GET views. `before` runs first on every request (e.g. a
+        cheap store refresh) so the version reflects the latest data.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if before is not None:
+                    before()
+
+                key = request.full_path
+                state = self._state()
+                if state is None:
+                    return view(*args, **kwargs)
+                version = (self.version, state)
+                etag = self._etag(key, state)
+                last_modified = formatdate(self.last_modified, usegmt=True)
+
+                if request.if_none_match.contains(etag):
+                    response = make_response("", 304)
+                    response.set_etag(etag)
+                    response.headers['Last-Modified'] = last_modified
+                    return response
+
+                now = time.time()
+                with self._lock:
+                    entry = self._entries.get(key)
+                if entry and entry[0] == version and entry[1] > now:
+                    body, status, mimetype = entry[2], entry[3], entry[4]
+                    response = make_response(body, status)
+                    response.mimetype = mimetype
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    with self._lock:
+                        if len(self._entries) >= self.max_entries:
+                            self._entries.pop(next(iter(self._entries)))
+                        self._entries[key] = (
+                            version, now + (ttl or self.ttl),
+                            response.get_data(), response.status_code, response.mimetype
+                        )
+
+                response.set_etag(etag)
+                response.headers['Last-Modified'] = last_modified
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+            return wrapper
+        return decorator
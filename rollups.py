@@ -0,0 +1,183 @@
+"""
+Pre-bucketed prescription counts for the dashboard trend charts.
+
+    python rollups.py [--store prescriptions.sqlite3]    rebuild from history
+"""
+import argparse
+import os
+from collections import defaultdict
+from datetime import date, timedelta
+
+ALL_MEDICINES = "*"
+BUCKETS = ("day", "week")
+
+
+def week_start(day):
+    """ISO week bucket of a YYYY-MM-DD date: the Monday it belongs to"""
+    parsed = date.fromisoformat(day)
+    return (parsed - timedelta(days=parsed.weekday())).isoformat()
+
+
+def period_count(bucket, date_from, date_to):
+    """len(periods(...)) without building the keys"""
+    start = date.fromisoformat(date_from if bucket == "day" else week_start(date_from))
+    days = (date.fromisoformat(date_to) - start).days
+    if days < 0:
+        return 0
+    return days + 1 if bucket == "day" else days // 7 + 1
+
+
+def periods(bucket, date_from, date_to):
+    """Every bucket key from date_from to date_to inclusive"""
+    start = date.fromisoformat(date_from if bucket == "day" else week_start(date_from))
+    end = date.fromisoformat(date_to)
+    step = timedelta(days=1 if bucket == "day" else 7)
+    keys = []
+    while start <= end:
+        keys.append(start.isoformat())
+        start += step
+    return keys
+
+
+class Rollups:
+    """
+    Prescription and tablet counts per day and per ISO week, overall and per
+    medicine, in a rollup table inside the store's database.
+
+    Counts are bumped by a store write hook in the same transaction that
+    saves the rows, so they never drift and every worker sees them. A trend
+    query reads one primary-key range of (bucket, medicine, period) rows:
+    a year of daily data is at most 366 rows whatever the total history.
+    rebuild() recomputes everything from the prescriptions table.
+    """
+
+    def __init__(self, store, normalize=None):
+        self.store = store
+        self.normalize = normalize
+        with store.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rollups ("
+                "bucket TEXT, medicine TEXT, period TEXT, prescriptions INTEGER, tablets INTEGER, "
+                "PRIMARY KEY (bucket, medicine, period))"
+            )
+        store.add_write_hook(self._apply)
+
+    def _counts(self, records):
+        """{(bucket, medicine, period): [prescriptions, tablets]} for a batch of records"""
+        counts = defaultdict(lambda: [0, 0])
+        for record in records:
+            day = str(record.get('Date') or '')
+            try:
+                week = week_start(day)
+            except ValueError:
+                continue
+            try:
+                tablets = int(record.get('Total Tablets') or 0)
+            except (TypeError, ValueError):
+                tablets = 0
+
+            medicine = record.get('Medicine Name') or ''
+            medicines = [ALL_MEDICINES]
+            if medicine and medicine != '-':
+                medicines.append(self.normalize(medicine) if self.normalize else medicine)
+
+            for bucket, period in (("day", day), ("week", week)):
+                for name in medicines:
+                    entry = counts[(bucket, name, period)]
+                    entry[0] += 1
+                    entry[1] += tablets
+        return counts
+
+    def _apply(self, conn, records):
+        conn.executemany(
+            "INSERT INTO rollups (bucket, medicine, period, prescriptions, tablets) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (bucket, medicine, period) DO UPDATE SET "
+            "prescriptions = prescriptions + excluded.prescriptions, tablets = tablets + excluded.tablets",
+            [key + tuple(value) for key, value in self._counts(records).items()]
+        )
+
+    def rebuild(self, only_if_empty=False):
+        """
+        Recompute the rollups from every stored prescription in one
+        transaction. With only_if_empty, do nothing when rollups already
+        exist (safe for several workers starting at once). Returns the
+        number of rollup rows written, or None if skipped.
+        """
+        headers = ['Date', 'Medicine Name', 'Total Tablets']
+        with self.store.transaction() as conn:
+            if only_if_empty and conn.execute("SELECT 1 FROM rollups LIMIT 1").fetchone():
+                return None
+            conn.execute("DELETE FROM rollups")
+            cursor = conn.execute("SELECT date, medicine_name, total_tablets FROM prescriptions")
+            counts = self._counts(dict(zip(headers, row)) for row in cursor)
+            conn.executemany(
+                "INSERT INTO rollups (bucket, medicine, period, prescriptions, tablets) VALUES (?, ?, ?, ?, ?)",
+                [key + tuple(value) for key, value in counts.items()]
+            )
+        return len(counts)
+
+    def series(self, bucket, date_from, date_to, medicine=None):
+        """[{"period", "prescriptions", "tablets"}] for every bucket in the range, zeros included"""
+        keys = periods(bucket, date_from, date_to)
+        if not keys:
+            return []
+        rows = self.store.query(
+            "SELECT period, prescriptions, tablets FROM rollups "
+            "WHERE bucket = ? AND medicine = ? AND period BETWEEN ? AND ?",
+            (bucket, medicine or ALL_MEDICINES, keys[0], keys[-1])
+        )
+        found = {row[0]: (row[1], row[2]) for row in rows}
+        return [
+            {"period": key, "prescriptions": found.get(key, (0, 0))[0], "tablets": found.get(key, (0, 0))[1]}
+            for key in keys
+        ]
+
+    def top_medicines(self, date_from, date_to, limit=5):
+        """
+        (medicine, prescriptions) with the most prescriptions in the range:
+        whole weeks from the weekly rollups, the partial weeks at either end
+        from the daily ones
+        """
+        first = date.fromisoformat(date_from)
+        last = date.fromisoformat(date_to)
+        first_monday = first + timedelta(days=-first.weekday() % 7)
+        last_monday = last - timedelta(days=(last.weekday() + 1) % 7 + 6)
+
+        if first_monday <= last_monday:
+            ranges = [
+                ("week", first_monday, last_monday),
+                ("day", first, first_monday - timedelta(days=1)),
+                ("day", last_monday + timedelta(days=7), last)
+            ]
+        else:
+            ranges = [("day", first, last)]
+        ranges = [(bucket, start.isoformat(), end.isoformat()) for bucket, start, end in ranges if start <= end]
+        if not ranges:
+            return []
+
+        where = " OR ".join("(bucket = ? AND period BETWEEN ? AND ?)" for _ in ranges)
+        params = [value for bounds in ranges for value in bounds]
+        rows = self.store.query(
+            f"SELECT medicine, SUM(prescriptions) AS n FROM rollups "
+            f"WHERE medicine != ? AND ({where}) "
+            f"GROUP BY medicine ORDER BY n DESC, medicine LIMIT ?",
+            [ALL_MEDICINES] + params + [limit]
+        )
+        return [(row[0], row[1]) for row in rows]
+
+
+def main(argv=None):
+    from extraction import SHEET_HEADERS
+    from formulary import canonical_medicine_name
+    from storage import SQLiteStore
+
+    parser = argparse.ArgumentParser(description="Rebuild the dashboard rollups from stored prescriptions")
+    parser.add_argument("--store", default=os.getenv("STORE_PATH", "prescriptions.sqlite3"))
+    args = parser.parse_args(argv)
+
+    rollups = Rollups(SQLiteStore(args.store, SHEET_HEADERS), normalize=canonical_medicine_name)
+    print(f"Rebuilt {rollups.rebuild()} rollup rows from {args.store}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class MemorySessionStore:
+    """
+    Conversation state kept in process memory, evicted after `ttl` seconds
+    of inactivity. Only suitable for a single worker process.
+    """
+
+    def __init__(self, ttl=3600, sweep_every=256):
+        self.ttl = ttl
+        self.sweep_every = sweep_every
+
+        self._lock = threading.Lock()
+        self._data = {}
+        self._writes = 0
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                return {}
+            if entry[0] < time.time():
+                del self._data[sid]
+                return {}
+            return json.loads(entry[1])
+
+    def set(self, sid, state):
+        with self._lock:
+            # Stored serialised so callers can't mutate shared state by accident
+            self._data[sid] = (time.time() + self.ttl, json.dumps(state))
+            self._writes += 1
+            if self._writes % self.sweep_every == 0:
+                self._sweep()
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def _sweep(self):
+        now = time.time()
+        for sid in [sid for sid, entry in self._data.items() if entry[0] < now]:
+            del self._data[sid]
+
+
+class SQLiteSessionStore:
+    """
+    Conversation state in a shared SQLite file so every gunicorn worker on
+    the host sees the same pending prescriptions. Expired rows are purged
+    periodically on write.
+    """
+
+    def __init__(self, path, ttl=3600, sweep_every=256):
+        self.path = path
+        self.ttl = ttl
+        self.sweep_every = sweep_every
+
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._writes = 0
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, state TEXT, expires REAL)")
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, sid):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT state FROM sessions WHERE sid = ? AND expires >= ?", (sid, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def set(self, sid, state):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (sid, state, expires) VALUES (?, ?, ?)",
+                (sid, json.dumps(state), time.time() + self.ttl)
+            )
+            self._writes += 1
+            if self._writes % self.sweep_every == 0:
+                conn.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),))
+            conn.commit()
+
+    def delete(self, sid):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+            conn.commit()
+
+
+def make_session_store():
+    """Build the store selected by SESSION_BACKEND ('sqlite' or 'memory')"""
+    ttl = int(os.getenv("SESSION_TTL", "3600"))
+    backend = os.getenv("SESSION_BACKEND", "sqlite").lower()
+    if backend == "memory":
+        return MemorySessionStore(ttl=ttl)
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.getenv("SESSION_DB_PATH", "sessions.sqlite3"), ttl=ttl)
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import gspread
+from oauth2client.service_account import ServiceAccountCredentials
+
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+
+class SheetUnavailable(Exception):
+    """Raised when the Google Sheets backend cannot be reached"""
+
+
+class SheetConnection:
+    """
+    Lazily-initialised, process-shared handle to the prescriptions worksheet.
+
+    Nothing touches the network at import time: the first caller of
+    worksheet() authorizes, opens the sheet and validates the header row,
+    and the result is cached for the life of the process. A failed connect
+    is retried at most once per `retry_interval` so a Sheets outage does not
+    add a timeout to every request. Once connected, a daemon thread keeps the
+    service-account token fresh so requests never pay for a refresh. Calls
+    made through run() drop the handle when they fail, so a worksheet that
+    went stale after an API error is reopened on the next call.
+    """
+
+    def __init__(self, keyfile, sheet_id, headers, retry_interval=30, refresh_interval=45 * 60):
+        self.keyfile = keyfile
+        self.sheet_id = sheet_id
+        self.headers = list(headers)
+        self.retry_interval = retry_interval
+        self.refresh_interval = refresh_interval
+
+        self._lock = threading.Lock()
+        self._creds = None
+        self._worksheet = None
+        self._last_error = None
+        self._last_attempt = 0
+        self._refresher = None
+
+    @property
+    def connected(self):
+        return self._worksheet is not None
+
+    @property
+    def last_range(self):
+        """A1 range covering the header columns, e.g. 'J' for ten columns"""
+        return chr(ord('A') + len(self.headers) - 1)
+
+    def worksheet(self):
+        """Return the cached worksheet, connecting on first use"""
+        if self._worksheet is not None:
+            return self._worksheet
+
+        with self._lock:
+            if self._worksheet is not None:
+                return self._worksheet
+
+            if self._last_error and time.time() - self._last_attempt < self.retry_interval:
+                raise SheetUnavailable(f"Google Sheets unavailable: {self._last_error}")
+
+            self._last_attempt = time.time()
+            try:
+                self._connect()
+                self._last_error = None
+            except Exception as e:
+                self._last_error = str(e)
+                print(f"Google Sheets connection failed: {str(e)}")
+                raise SheetUnavailable(f"Google Sheets unavailable: {str(e)}")
+
+        return self._worksheet
+
+    def run(self, operation):
+        """Call operation(worksheet), reconnecting on the next call if it fails"""
+        worksheet = self.worksheet()
+        try:
+            return operation(worksheet)
+        except Exception:
+            self.reset()
+            raise
+
+    def reset(self):
+        """Drop the cached handle so the next call reconnects"""
+        with self._lock:
+            self._worksheet = None
+
+    def _connect(self):
+        self._creds = ServiceAccountCredentials.from_json_keyfile_name(self.keyfile, SCOPE)
+        client = gspread.authorize(self._creds)
+        worksheet = client.open_by_key(self.sheet_id).sheet1
+        self._ensure_headers(worksheet)
+        self._worksheet = worksheet
+        print("Connected to Google Sheets")
+
+        if self._refresher is None or not self._refresher.is_alive():
+            self._refresher = threading.Thread(target=self._refresh_loop, name="sheet-token-refresh", daemon=True)
+            self._refresher.start()
+
+    def _ensure_headers(self, worksheet):
+        """Create or repair the header row once per process"""
+        existing = worksheet.row_values(1)
+        if existing == self.headers:
+            return
+
+        if not existing:
+            worksheet.append_row(self.headers)
+        else:
+            worksheet.update(f'A1:{self.last_range}1', [self.headers])
+        print("Headers created/updated successfully")
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                # Refreshes the access token when it is expired or close to it
+                self._creds.get_access_token()
+            except Exception as e:
+                print(f"Google Sheets token refresh failed: {str(e)}")
+                self.reset()
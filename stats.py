@@ -0,0 +1,77 @@
+import threading
+from collections import Counter
+
+
+class PrescriptionStats:
+    """
+    Admin dashboard counters maintained incrementally.
+
+    Records are folded in as they arrive (see PrescriptionStore.add_listener), so
+    reading the stats never touches the underlying rows: running total,
+    per-day counts, an exact set of distinct patients and a small top-K list
+    of medicines kept ordered by count. Counts only ever grow, so the top-K
+    list can be maintained in O(K) per record without rescanning.
+    `normalize` maps medicine names before counting, so brands and
+    misspellings of one drug are counted together.
+    """
+
+    def __init__(self, top_k=10, normalize=None):
+        self.top_k = top_k
+        self.normalize = normalize
+
+        self._lock = threading.Lock()
+        self.total = 0
+        self.per_day = Counter()
+        self.patients = set()
+        self.medicines = Counter()
+        self._top = []  # medicine names, highest count first
+
+    def add_records(self, records):
+        with self._lock:
+            for record in records:
+                self._add(record)
+
+    def _add(self, record):
+        self.total += 1
+        self.per_day[record.get('Date', '')] += 1
+
+        patient = record.get('Patient Name')
+        if patient:
+            self.patients.add(patient)
+
+        medicine = record.get('Medicine Name', '')
+        if medicine and medicine != '-':
+            if self.normalize:
+                medicine = self.normalize(medicine)
+            self.medicines[medicine] += 1
+            self._bump_top(medicine)
+
+    def _bump_top(self, medicine):
+        count = self.medicines[medicine]
+        if medicine in self._top:
+            self._top.remove(medicine)
+        elif len(self._top) >= self.top_k:
+            if count <= self.medicines[self._top[-1]]:
+                return
+            self._top.pop()
+
+        # Insert keeping the list ordered by count; ties keep the earlier leader
+        position = len(self._top)
+        while position > 0 and self.medicines[self._top[position - 1]] < count:
+            position -= 1
+        self._top.insert(position, medicine)
+
+    def snapshot(self, today):
+        """Dashboard numbers in O(1)"""
+        with self._lock:
+            return {
+                "totalPrescriptions": self.total,
+                "todayPrescriptions": self.per_day.get(today, 0),
+                "uniquePatients": len(self.patients),
+                "mostPrescribed": self._top[0] if self._top else "None"
+            }
+
+    def top_medicines(self, limit=None):
+        with self._lock:
+            names = self._top[:limit] if limit else list(self._top)
+            return [(name, self.medicines[name]) for name in names]
@@ -0,0 +1,435 @@
+import base64
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+INTEGER_COLUMNS = {"Times Per Day", "Total Tablets"}
+INDEXED_COLUMNS = ["Date", "Patient Name", "Medicine Name"]
+
+
+def column_name(header):
+    """'Patient Name' -> 'patient_name'"""
+    return header.strip().lower().replace(' ', '_')
+
+
+def encode_cursor(date, row_number):
+    return base64.urlsafe_b64encode(f"{date}|{row_number}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        date, row_number = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return date, int(row_number)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class PrescriptionStore(ABC):
+    """
+    Interface of the prescriptions system of record.
+
+    Rows are lists of values in `headers` order (the same shape the sheet
+    export uses); query results are header-keyed dicts. Listeners registered
+    with add_listener() are called with every batch of newly stored records
+    (each carrying its id as "_row"), so in-memory aggregates stay current.
+    """
+
+    @abstractmethod
+    def add_listener(self, listener):
+        """Register fn(records) for every batch of newly stored records"""
+
+    @abstractmethod
+    def add_write_hook(self, hook):
+        """Register fn(conn, records) to run inside every write transaction"""
+
+    def append(self, row):
+        """Store one row and return its id"""
+        return self.append_many([row])[0]
+
+    @abstractmethod
+    def append_many(self, rows):
+        """Store rows in one transaction and return their ids"""
+
+    @abstractmethod
+    def refresh(self):
+        """Hand records written by other processes to this process's listeners"""
+
+    @abstractmethod
+    def history_imported(self):
+        """Whether import_history() has completed for this store"""
+
+    @abstractmethod
+    def import_history(self, numbered_rows):
+        """Copy pre-existing (row number, row) pairs in once; None if already done"""
+
+    @abstractmethod
+    def page(self, filters=None, cursor=None, limit=100, fields=None):
+        """One page of matching records, newest first: (records, next_cursor)"""
+
+    @abstractmethod
+    def iter_records(self, filters=None, fields=None, batch_size=500):
+        """Stream every matching record, newest first"""
+
+    @abstractmethod
+    def records_by_id(self, ids, fields=None):
+        """Records for the given ids, in the order given"""
+
+    @abstractmethod
+    def count(self, where="", params=()):
+        """Number of rows matching an SQL condition"""
+
+    @abstractmethod
+    def distinct_count(self, header):
+        """Number of distinct non-empty values in a column"""
+
+    @abstractmethod
+    def top_values(self, header, limit=1, exclude=("", "-")):
+        """Most frequent values of a column as (value, count) pairs"""
+
+    @abstractmethod
+    def data_version(self):
+        """Token that changes whenever rows are stored, the same in every process"""
+
+
+class SQLiteStore(PrescriptionStore):
+    """
+    Prescriptions in a local SQLite database (WAL mode): the primary store.
+
+    Writes are a local transaction, so saving never waits on the network;
+    Google Sheets only receives an asynchronous export (see WriteBehindQueue).
+    Date, Patient Name and Medicine Name are indexed so the admin endpoints
+    answer from local disk.
+
+    The database file is shared between workers. Each process keeps its own
+    high-water mark and hands rows it has not seen yet to its listeners:
+    immediately for its own writes, and on refresh() (a primary-key range
+    scan) for rows other workers wrote. Rows are streamed to the listeners in
+    chunks of `notify_batch`, one thread at a time; a caller that finds
+    another thread delivering leaves its rows to that thread instead of
+    waiting, so a worker's first catch-up (see warm()) never blocks
+    requests. Write hooks run inside the writing transaction instead, for
+    derived tables that must never drift from the rows (e.g. rollups).
+    """
+
+    def __init__(self, path, headers, notify_batch=5000):
+        self.path = path
+        self.notify_batch = notify_batch
+        self.headers = list(headers)
+        self.columns = [column_name(header) for header in self.headers]
+
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+        self._seen_row = 0
+        self._listeners = []
+        self._write_hooks = []
+        self._notify_lock = threading.Lock()
+        self._notify_requested = False
+
+    # ------------------------------------------------------------------
+    # Connection / schema
+    # ------------------------------------------------------------------
+    def connection(self):
+        # sqlite connections must not cross a gunicorn fork
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._pid = os.getpid()
+            self._create_schema()
+        return self._conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        Write transaction on the shared connection for derived tables kept in
+        the same database; BEGIN IMMEDIATE, so workers take turns. Commits on
+        success and rolls back on any error.
+        """
+        with self._lock:
+            conn = self.connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def query(self, sql, params=()):
+        """All rows of a read-only statement on the shared connection"""
+        with self._lock:
+            return self.connection().execute(sql, params).fetchall()
+
+    def _create_schema(self):
+        column_defs = ", ".join(
+            f"{name} {'INTEGER' if header in INTEGER_COLUMNS else 'TEXT'}"
+            for header, name in zip(self.headers, self.columns)
+        )
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS prescriptions (row_number INTEGER PRIMARY KEY, {column_defs})")
+        for header in INDEXED_COLUMNS:
+            name = column_name(header)
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_prescriptions_{name} ON prescriptions ({name})")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+    def add_listener(self, listener):
+        """Register fn(records) to be called with each batch of newly seen rows"""
+        self._listeners.append(listener)
+
+    def add_write_hook(self, hook):
+        self._write_hooks.append(hook)
+
+    @property
+    def seen_row(self):
+        """Newest row id this process's listeners have been given"""
+        return self._seen_row
+
+    def _run_write_hooks(self, conn, values):
+        if self._write_hooks:
+            records = [dict(zip(self.headers, row)) for row in values]
+            for hook in self._write_hooks:
+                hook(conn, records)
+
+    def append_many(self, rows):
+        values = [self._values(row) for row in rows]
+        if not values:
+            return []
+
+        placeholders = ", ".join("?" for _ in self.columns)
+        with self._lock:
+            conn = self.connection()
+            ids = []
+            with conn:
+                for row in values:
+                    cursor = conn.execute(
+                        f"INSERT INTO prescriptions ({', '.join(self.columns)}) VALUES ({placeholders})", row
+                    )
+                    ids.append(cursor.lastrowid)
+                self._run_write_hooks(conn, values)
+        self._notify_listeners()
+        return ids
+
+    def history_imported(self):
+        with self._lock:
+            return self.connection().execute(
+                "SELECT 1 FROM store_meta WHERE key = 'history_imported'"
+            ).fetchone() is not None
+
+    def import_history(self, numbered_rows):
+        """
+        Copy rows written before the store existed (the sheet's history, as
+        (sheet row number, row) pairs) and mark the import done, in one
+        transaction. An empty store keeps the sheet row numbers as ids; rows
+        saved meanwhile make the history get new ids after them. Returns the
+        number imported, or None if an import already completed; safe when
+        several workers race.
+        """
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM store_meta WHERE key = 'history_imported'").fetchone():
+                return None
+            keep_ids = conn.execute("SELECT 1 FROM prescriptions LIMIT 1").fetchone() is None
+            records = [
+                [row_number] + self._values(row) if keep_ids else self._values(row)
+                for row_number, row in numbered_rows
+                if any(cell for cell in row)
+            ]
+            columns = (["row_number"] if keep_ids else []) + self.columns
+            conn.executemany(
+                f"INSERT INTO prescriptions ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                records
+            )
+            self._run_write_hooks(conn, [record[1:] if keep_ids else record for record in records])
+            conn.execute("INSERT INTO store_meta (key, value) VALUES ('history_imported', ?)", (str(len(records)),))
+        self._notify_listeners()
+        return len(records)
+
+    def refresh(self):
+        self._notify_listeners()
+
+    def warm(self):
+        """Catch the listeners up with every stored row on a background thread"""
+        thread = threading.Thread(target=self._notify_listeners, name="store-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def _values(self, row):
+        row = list(row) + [""] * (len(self.headers) - len(row))
+        return [self._convert(header, value) for header, value in zip(self.headers, row)]
+
+    def _convert(self, header, value):
+        if header in INTEGER_COLUMNS:
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                return value
+        return value
+
+    def _notify_listeners(self):
+        self._notify_requested = True
+        while self._notify_requested:
+            if not self._notify_lock.acquire(blocking=False):
+                # The delivering thread sees the request once it is done
+                return
+            try:
+                self._notify_requested = False
+                while self._deliver_chunk():
+                    pass
+            finally:
+                self._notify_lock.release()
+
+    def _deliver_chunk(self):
+        """Hand the next unseen rows to the listeners; False once caught up"""
+        with self._lock:
+            rows = self.connection().execute(
+                "SELECT * FROM prescriptions WHERE row_number > ? ORDER BY row_number LIMIT ?",
+                (self._seen_row, self.notify_batch)
+            ).fetchall()
+        records = [self._to_record(row, include_row=True) for row in rows]
+        if not records:
+            return False
+
+        for listener in self._listeners:
+            try:
+                listener(records)
+            except Exception as e:
+                print(f"Store listener error: {str(e)}")
+        # Only now is the chunk folded in everywhere (seen_row gates caching)
+        self._seen_row = records[-1]["_row"]
+        return len(records) == self.notify_batch
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def _to_record(self, row, include_row=False):
+        record = {header: row[name] for header, name in zip(self.headers, self.columns)}
+        if include_row:
+            record["_row"] = row["row_number"]
+        return record
+
+    def _filter_sql(self, filters):
+        """WHERE clauses for date range / patient / medicine filters (all indexed)"""
+        clauses, params = [], []
+        if filters.get('date_from'):
+            clauses.append("date >= ?")
+            params.append(filters['date_from'])
+        if filters.get('date_to'):
+            clauses.append("date <= ?")
+            params.append(filters['date_to'])
+        if filters.get('patient'):
+            clauses.append("patient_name = ?")
+            params.append(filters['patient'])
+        if filters.get('medicine'):
+            clauses.append("medicine_name = ?")
+            params.append(filters['medicine'])
+        return clauses, params
+
+    def _projection(self, fields):
+        headers = [header for header in (fields or self.headers) if header in self.headers]
+        return headers or self.headers
+
+    def page(self, filters=None, cursor=None, limit=100, fields=None):
+        """
+        One page of records, newest first, using keyset pagination on
+        (Date, row number) so every page is an index range scan no matter how
+        deep the client has paged. Returns (records, next_cursor).
+        """
+        clauses, params = self._filter_sql(filters or {})
+        if cursor:
+            date, row_number = decode_cursor(cursor)
+            clauses.append("(date < ? OR (date = ? AND row_number < ?))")
+            params.extend([date, date, row_number])
+
+        headers = self._projection(fields)
+        sql = f"SELECT row_number, date, {', '.join(column_name(h) for h in headers)} FROM prescriptions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY date DESC, row_number DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self.connection().execute(sql, params).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["date"], rows[-1]["row_number"])
+
+        return [{h: row[column_name(h)] for h in headers} for row in rows], next_cursor
+
+    def iter_records(self, filters=None, fields=None, batch_size=500):
+        """
+        Stream matching records newest first without materialising the result.
+        Uses its own connection so a slow client never holds the shared lock.
+        """
+        clauses, params = self._filter_sql(filters or {})
+        headers = self._projection(fields)
+        sql = f"SELECT {', '.join(column_name(h) for h in headers)} FROM prescriptions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY date DESC, row_number DESC"
+
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(headers, row))
+        finally:
+            conn.close()
+
+    def records_by_id(self, ids, fields=None):
+        """Primary-key lookups for the given ids, returned in the order given"""
+        if not ids:
+            return []
+        headers = self._projection(fields)
+        placeholders = ", ".join("?" for _ in ids)
+        with self._lock:
+            rows = self.connection().execute(
+                f"SELECT row_number, {', '.join(column_name(h) for h in headers)} FROM prescriptions "
+                f"WHERE row_number IN ({placeholders})",
+                list(ids)
+            ).fetchall()
+        by_id = {row["row_number"]: {h: row[column_name(h)] for h in headers} for row in rows}
+        return [by_id[row_id] for row_id in ids if row_id in by_id]
+
+    def count(self, where="", params=()):
+        sql = "SELECT COUNT(*) FROM prescriptions"
+        if where:
+            sql += f" WHERE {where}"
+        with self._lock:
+            return self.connection().execute(sql, params).fetchone()[0]
+
+    def data_version(self):
+        """The newest row id: rows are only ever appended"""
+        with self._lock:
+            return self.connection().execute("SELECT MAX(row_number) FROM prescriptions").fetchone()[0] or 0
+
+    def distinct_count(self, header):
+        """Number of distinct non-empty values in a column"""
+        name = column_name(header)
+        with self._lock:
+            return self.connection().execute(
+                f"SELECT COUNT(DISTINCT {name}) FROM prescriptions WHERE {name} != ''"
+            ).fetchone()[0]
+
+    def top_values(self, header, limit=1, exclude=("", "-")):
+        """Most frequent values of a column as (value, count) pairs"""
+        name = column_name(header)
+        placeholders = ", ".join("?" for _ in exclude)
+        with self._lock:
+            rows = self.connection().execute(
+                f"SELECT {name}, COUNT(*) AS n FROM prescriptions WHERE {name} NOT IN ({placeholders}) "
+                f"GROUP BY {name} ORDER BY n DESC LIMIT ?",
+                tuple(exclude) + (limit,)
+            ).fetchall()
+        return [(row[0], row[1]) for row in rows]
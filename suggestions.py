@@ -0,0 +1,90 @@
+import threading
+from collections import Counter
+
+from formulary import canonical_medicine_name, get_formulary, normalize_drug_name
+
+
+class MedicineSuggester:
+    """
+    Type-ahead for medicine names, ranked by how often the clinic has
+    prescribed them.
+
+    Every name variant (the canonical name, its brands in the formulary,
+    and each word inside a name) is indexed under all of its prefixes up to
+    `max_prefix` characters, and every prefix keeps its own top `limit`
+    canonical names ordered by count. Lookups are one dict access; saving a
+    record only re-ranks the prefixes of that one medicine. Names never
+    prescribed still appear (after prescribed ones) so new drugs can be
+    found; the empty query lists prescribed names only.
+    """
+
+    def __init__(self, formulary=None, limit=10, max_prefix=12):
+        self.limit = limit
+        self.max_prefix = max_prefix
+
+        self._lock = threading.Lock()
+        self.counts = Counter()
+        self._variants = {}  # canonical name -> normalised keys it is found under
+        self._prefixes = {}  # prefix -> canonical names, best first
+
+        formulary = formulary or get_formulary()
+        for key, generic in formulary.names_with_prefix(""):
+            self._add_variant(generic, key)
+        with self._lock:
+            for name in self._variants:
+                self._rank(name)
+
+    def add_records(self, records):
+        """Store listener: count each saved prescription's medicine"""
+        batch = Counter()
+        for record in records:
+            medicine = record.get('Medicine Name', '')
+            if medicine and medicine not in ('-', 'Not specified'):
+                batch[canonical_medicine_name(medicine)] += 1
+
+        # Re-rank once per distinct name, not once per record
+        with self._lock:
+            for name, count in batch.items():
+                if name not in self._variants:
+                    self._add_variant(name, normalize_drug_name(name))
+                self.counts[name] += count
+                self._rank(name)
+
+    def suggest(self, query="", limit=None):
+        """[{"name", "count"}] for names matching `query`, most prescribed first"""
+        key = normalize_drug_name(query)
+        prefix = key[:self.max_prefix]
+        with self._lock:
+            names = self._prefixes.get(prefix, [])
+            if len(key) > self.max_prefix:
+                # Only the first max_prefix characters are indexed
+                names = [name for name in names if any(variant.startswith(key) for variant in self._variants[name])]
+            return [{"name": name, "count": self.counts[name]} for name in names[:limit or self.limit]]
+
+    def _add_variant(self, name, key):
+        keys = self._variants.setdefault(name, set())
+        keys.add(key)
+        # "clav" should find "Amoxicillin + Clavulanic Acid"
+        words = key.split(" ")
+        for i in range(1, len(words)):
+            keys.add(" ".join(words[i:]))
+
+    def _sort_key(self, name):
+        return (-self.counts[name], name)
+
+    def _rank(self, name):
+        prefixes = set()
+        for key in self._variants[name]:
+            for length in range(1, min(len(key), self.max_prefix) + 1):
+                prefixes.add(key[:length])
+        if self.counts[name]:
+            prefixes.add("")
+
+        for prefix in prefixes:
+            ranked = self._prefixes.setdefault(prefix, [])
+            if name not in ranked:
+                if len(ranked) >= self.limit and self._sort_key(name) >= self._sort_key(ranked[-1]):
+                    continue
+                ranked.append(name)
+            ranked.sort(key=self._sort_key)
+            del ranked[self.limit:]
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """The Flask app on a throwaway store, running offline (SHEET_EXPORT=0)"""
+    data_dir = tmp_path_factory.mktemp("app")
+    os.environ["STORE_PATH"] = str(data_dir / "prescriptions.sqlite3")
+    os.environ["WRITE_QUEUE_PATH"] = str(data_dir / "queue.journal")
+    os.environ["SESSION_DB_PATH"] = str(data_dir / "sessions.sqlite3")
+    os.environ["SHEET_EXPORT"] = "0"
+    import app
+    app.store.import_history([])
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,14 @@
+"""Filters of GET /admin/prescriptions"""
+
+
+def test_medicine_filter_is_canonicalized(app_module, client):
+    row = ["Admin Filter Patient", "2022-02-02", "Paracetamol", "3 days", "days", "Morning", "after food", 1, 3, "-"]
+    app_module.save_rows([row])
+    for medicine in ("dolo", "Paracetamol", "paracetmol"):
+        body = client.get(f"/admin/prescriptions?medicine={medicine}&date_from=2022-02-02&date_to=2022-02-02").get_json()
+        assert [r["Patient Name"] for r in body["records"]] == ["Admin Filter Patient"]
+
+
+def test_unfiltered_listing_is_unaffected(client):
+    body = client.get("/admin/prescriptions?limit=1").get_json()
+    assert body["success"]
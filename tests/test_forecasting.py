@@ -0,0 +1,35 @@
+"""Demand forecast and the /admin/forecast endpoint"""
+from datetime import date
+
+from forecasting import DemandForecaster
+from formulary import canonical_medicine_name
+
+
+def record(medicine, start, days, per_day):
+    return {"Medicine Name": medicine, "Date": start, "Duration": f"{days} days",
+            "Duration Unit": "days", "Times Per Day": per_day}
+
+
+def test_demand_per_day():
+    forecaster = DemandForecaster(normalize=canonical_medicine_name)
+    forecaster.add_records([record("Dolo", "2026-10-01", 3, 2), record("Paracetamol", "2026-10-02", 2, 1)])
+    names, demand = forecaster.forecast(date(2026, 10, 1), 4)
+    assert names == ["Paracetamol"]
+    assert demand.tolist() == [[2, 3, 3, 0]]
+
+
+def test_total_covers_only_the_filtered_medicines():
+    forecaster = DemandForecaster()
+    forecaster.add_records([record("Paracetamol", "2026-10-01", 3, 2), record("Azithromycin", "2026-10-01", 5, 2)])
+    summary = forecaster.summary(date(2026, 10, 1), 7, medicine="Paracetamol")
+    assert [m["name"] for m in summary["medicines"]] == ["Paracetamol"]
+    assert summary["total_tablets"] == 6
+    assert forecaster.summary(date(2026, 10, 1), 7)["total_tablets"] == 16
+
+
+def test_forecast_medicine_filter_is_canonicalized(app_module, client):
+    row = ["Forecast Patient", "2024-06-03", "Dolo", "3 days", "days", "Morning, Night", "after food", 2, 6, "-"]
+    app_module.save_rows([row])
+    body = client.get("/admin/forecast?start=2024-06-03&days=7&medicine=paracetamol").get_json()
+    assert [(m["name"], m["total"]) for m in body["medicines"]] == [("Paracetamol", 6)]
+    assert body["total_tablets"] == 6
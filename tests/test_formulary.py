@@ -0,0 +1,51 @@
+"""Medicine names are only resolved to drugs the formulary lists"""
+import pytest
+
+from extraction import local_extract
+from formulary import Formulary, canonical_medicine_name
+
+
+@pytest.mark.parametrize("typed, kept", [
+    ("linagliptin", "Linagliptin"),
+    ("citalopram", "Citalopram"),
+    ("ornidazole", "Ornidazole"),
+    ("prednisone", "Prednisone"),
+])
+def test_close_but_different_drugs_keep_the_typed_name(typed, kept):
+    assert canonical_medicine_name(typed) == kept
+
+
+@pytest.mark.parametrize("typed, generic", [
+    ("Tab Dolo 650", "Paracetamol"),
+    ("paracetmol", "Paracetamol"),
+    ("Augmentin 625", "Amoxicillin + Clavulanic Acid"),
+])
+def test_brands_and_listed_misspellings_resolve(typed, generic):
+    assert canonical_medicine_name(typed) == generic
+
+
+def test_unknown_medicine_is_not_confident():
+    prescription, _, confident = local_extract("linagliptin 5mg once a day for 30 days after food")
+    assert prescription["Medicine Name"] == "Linagliptin"
+    assert not confident
+
+
+@pytest.mark.parametrize("text, typed", [
+    ("amoxicillin clavulanate 625 twice a day for 5 days after food", "Amoxicillin Clavulanate"),
+    ("metformin glimepiride once a day for 1 month before food", "Metformin Glimepiride"),
+])
+def test_combination_is_not_resolved_to_its_first_drug(text, typed):
+    prescription, _, confident = local_extract(text)
+    assert prescription["Medicine Name"] == typed
+    assert not confident
+
+
+def test_filler_after_the_name_still_resolves():
+    assert canonical_medicine_name("Aspirin every") == "Aspirin"
+    assert canonical_medicine_name("Dolo 650 tab") == "Paracetamol"
+
+
+def test_closest_requires_a_single_generic():
+    formulary = Formulary([("Tinidazole", "Tinidazole"), ("Ornidazole", "Ornidazole")])
+    assert formulary.closest("tinidazol") == "Tinidazole"
+    assert formulary.closest("rinidazole") is None
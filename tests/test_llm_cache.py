@@ -0,0 +1,39 @@
+"""Bounds of the on-disk extraction cache"""
+import sqlite3
+import time
+
+from llm_cache import ExtractionCache
+
+
+def disk_rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_disk_rows_are_capped_oldest_first(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ExtractionCache(max_size=1, path=path, max_disk_rows=3)
+    for number in range(5):
+        cache.set(f"text {number}", {"n": number})
+        time.sleep(0.001)
+
+    assert disk_rows(path) == 3
+    fresh = ExtractionCache(max_size=1, path=path, max_disk_rows=3)
+    assert fresh.get("text 0") is None
+    assert fresh.get("text 4") == {"n": 4}
+
+
+def test_expired_rows_are_purged_on_open(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    ExtractionCache(path=path).get("creates the table")
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO extraction_cache VALUES ('stale', '{}', ?)", (time.time() - 1,))
+    conn.commit()
+    conn.close()
+
+    ExtractionCache(path=path).get("anything")
+
+    assert disk_rows(path) == 0
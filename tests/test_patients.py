@@ -0,0 +1,31 @@
+"""Per-patient history lookups"""
+from patients import PatientIndex
+
+
+def record(row_id, patient, date):
+    return {"_row": row_id, "Patient Name": patient, "Date": date}
+
+
+def test_newest_first_follows_dates_not_row_ids():
+    index = PatientIndex()
+    # Saved today, then older history imported afterwards with later ids
+    index.add_records([record(1, "Ann", "2026-10-18")])
+    index.add_records([record(2, "ann", "2023-01-05"), record(3, " ANN ", "2023-02-09")])
+    assert index.row_ids("ann", 2) == [1, 3]
+    assert index.row_ids("Ann") == [1, 3, 2]
+    assert index.count("ann") == 3
+
+
+def test_same_day_rows_keep_save_order():
+    index = PatientIndex()
+    index.add_records([record(5, "bob", "2026-10-18"), record(6, "bob", "2026-10-18")])
+    assert index.row_ids("bob") == [6, 5]
+
+
+def test_recent_list_after_a_late_history_import(app_module, client):
+    store = app_module.store
+    app_module.save_rows([["Late Import Patient", "2026-10-18", "Dolo", "3", "days", "Morning", "after food", 1, 3, "-"]])
+    store.append_many([["Late Import Patient", "2023-01-0%d" % day, "Azithral", "3", "days", "Morning",
+                        "after food", 1, 3, "-"] for day in range(1, 4)])
+    records = client.get("/patients/late import patient/prescriptions?limit=2").get_json()["records"]
+    assert [r["Date"] for r in records] == ["2026-10-18", "2023-01-03"]
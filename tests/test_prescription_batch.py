@@ -0,0 +1,26 @@
+"""Input validation of POST /prescriptions/batch"""
+import pytest
+
+TEXT = "dolo 650 twice a day for 3 days after food"
+
+
+@pytest.mark.parametrize("body", [
+    {"prescriptions": [TEXT]},
+    {"name": "  ", "prescriptions": [TEXT]},
+    {"name": "Ann", "prescriptions": [TEXT], "date": "2026-1-5"},
+    {"name": "Ann", "prescriptions": [TEXT], "date": "18/10/2026"},
+    {"name": "Ann", "prescriptions": []},
+])
+def test_invalid_batches_are_rejected(client, body):
+    response = client.post("/prescriptions/batch", json=body)
+    assert response.status_code == 400
+    assert not response.get_json()["success"]
+
+
+def test_saved_rows_use_iso_dates(app_module, client):
+    response = client.post("/prescriptions/batch", json={
+        "name": " Batch Date Patient ", "prescriptions": [TEXT], "date": "2026-10-05"
+    })
+    assert response.get_json()["saved"] == 1
+    records = app_module.recent_prescriptions("batch date patient")
+    assert [(r["Patient Name"], r["Date"]) for r in records] == [("Batch Date Patient", "2026-10-05")]
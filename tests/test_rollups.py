@@ -0,0 +1,66 @@
+"""Trend rollups and the /admin/trends endpoint"""
+import pytest
+
+from extraction import SHEET_HEADERS
+from formulary import canonical_medicine_name
+from rollups import Rollups, period_count, periods
+from storage import SQLiteStore
+
+
+def row(date, medicine, tablets=6):
+    return ["ann", date, medicine, "3", "days", "Morning, Night", "after food", 2, tablets, "-"]
+
+
+@pytest.fixture
+def rollups(tmp_path):
+    store = SQLiteStore(str(tmp_path / "store.db"), SHEET_HEADERS)
+    return Rollups(store, normalize=canonical_medicine_name)
+
+
+@pytest.mark.parametrize("bucket", ["day", "week"])
+@pytest.mark.parametrize("date_from, date_to", [
+    ("2026-10-01", "2026-10-31"),
+    ("2026-10-04", "2026-10-05"),
+    ("2026-10-18", "2026-10-18"),
+    ("2026-10-20", "2026-10-01"),
+])
+def test_period_count_matches_periods(bucket, date_from, date_to):
+    assert period_count(bucket, date_from, date_to) == len(periods(bucket, date_from, date_to))
+
+
+def test_rows_are_counted_under_their_canonical_name(rollups):
+    rollups.store.append_many([row("2026-10-17", "Dolo"), row("2026-10-18", "Paracetamol", 10)])
+    series = rollups.series("day", "2026-10-17", "2026-10-18", "Paracetamol")
+    assert [(p["prescriptions"], p["tablets"]) for p in series] == [(1, 6), (1, 10)]
+    assert rollups.top_medicines("2026-10-01", "2026-10-31") == [("Paracetamol", 2)]
+
+
+def test_top_medicines_of_an_empty_range(rollups):
+    rollups.store.append_many([row("2026-10-18", "Paracetamol")])
+    assert rollups.top_medicines("2026-10-20", "2026-10-01") == []
+
+
+def test_rebuild_matches_the_incremental_counts(rollups):
+    rollups.store.append_many([row("2026-10-%02d" % day, "Dolo" if day % 2 else "Azithral") for day in range(1, 29)])
+    before = rollups.store.query("SELECT * FROM rollups ORDER BY bucket, medicine, period")
+    rollups.rebuild()
+    after = rollups.store.query("SELECT * FROM rollups ORDER BY bucket, medicine, period")
+    assert [tuple(r) for r in before] == [tuple(r) for r in after]
+
+
+def test_trends_reject_an_inverted_range(client):
+    response = client.get("/admin/trends?top=3&date_from=2026-10-20&date_to=2026-10-01")
+    assert response.status_code == 400
+    assert not response.get_json()["success"]
+
+
+def test_trends_reject_an_oversized_range(client):
+    response = client.get("/admin/trends?date_from=0001-01-01&date_to=2026-10-18")
+    assert response.status_code == 400
+
+
+def test_trends_medicine_filter_is_canonicalized(app_module, client):
+    app_module.save_rows([row("2025-03-03", "Dolo"), row("2025-03-04", "Crocin")])
+    body = client.get("/admin/trends?medicine=dolo&date_from=2025-03-03&date_to=2025-03-04").get_json()
+    assert body["medicine"] == "Paracetamol"
+    assert [p["prescriptions"] for p in body["series"]] == [1, 1]
@@ -0,0 +1,46 @@
+"""Listener catch-up of the SQLite store"""
+import pytest
+
+from extraction import SHEET_HEADERS
+from storage import SQLiteStore
+
+
+def row(patient, date, medicine="Paracetamol", tablets=6):
+    return [patient, date, medicine, "3", "days", "Morning, Night", "after food", 2, tablets, "-"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteStore(str(tmp_path / "store.db"), SHEET_HEADERS, notify_batch=4)
+
+
+@pytest.fixture
+def other_worker(tmp_path):
+    return SQLiteStore(str(tmp_path / "store.db"), SHEET_HEADERS)
+
+
+def test_catch_up_is_delivered_in_chunks(store, other_worker):
+    other_worker.append_many([row("ann", "2026-10-18")] * 10)
+    chunks = []
+    store.add_listener(lambda records: chunks.append([r["_row"] for r in records]))
+    store.refresh()
+    assert chunks == [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10]]
+    assert store.seen_row == store.data_version() == 10
+
+
+def test_seen_row_waits_for_the_listeners(store, other_worker):
+    other_worker.append_many([row("ann", "2026-10-18")] * 10)
+    seen_during = []
+    store.add_listener(lambda records: seen_during.append(store.seen_row))
+    store.refresh()
+    # While a chunk is being folded in, the store must not look caught up
+    assert seen_during == [0, 4, 8]
+
+
+def test_own_writes_reach_the_listeners_once(store):
+    delivered = []
+    store.add_listener(lambda records: delivered.extend(r["_row"] for r in records))
+    store.append_many([row("ann", "2026-10-18")])
+    store.append_many([row("bob", "2026-10-18")] * 2)
+    store.refresh()
+    assert delivered == [1, 2, 3]
@@ -0,0 +1,29 @@
+"""Medicine type-ahead ranking"""
+from formulary import Formulary
+from suggestions import MedicineSuggester
+
+
+def make_suggester():
+    formulary = Formulary([
+        ("Amoxicillin", "Amoxicillin"),
+        ("Amoxicillin + Clavulanic Acid", "Amoxicillin + Clavulanic Acid"),
+        ("Paracetamol", "Paracetamol"),
+    ])
+    return MedicineSuggester(formulary=formulary, max_prefix=6)
+
+
+def test_batch_counts_rank_most_prescribed_first():
+    suggester = make_suggester()
+    suggester.add_records([{"Medicine Name": "Amoxicillin + Clavulanic Acid"}] * 3 + [{"Medicine Name": "Amoxicillin"}])
+
+    assert suggester.suggest("amox") == [
+        {"name": "Amoxicillin + Clavulanic Acid", "count": 3},
+        {"name": "Amoxicillin", "count": 1},
+    ]
+
+
+def test_queries_longer_than_the_index_match_the_full_text():
+    suggester = make_suggester()
+
+    assert [s["name"] for s in suggester.suggest("amoxicillin clav")] == ["Amoxicillin + Clavulanic Acid"]
+    assert suggester.suggest("amoxicxyz") == []
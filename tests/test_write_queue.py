@@ -0,0 +1,155 @@
+"""Crash / replay behaviour of the write-behind journal"""
+import time
+
+import pytest
+
+from write_queue import WriteBehindQueue
+
+
+class FakeSheet:
+    """Append-only sheet; `crash_after_append` simulates dying before the ack"""
+
+    def __init__(self):
+        self.rows = []
+        self.crash_after_append = False
+        self.fail_before_append = False
+
+    def append_rows(self, rows):
+        if self.fail_before_append:
+            raise ConnectionError("sheet unavailable")
+        self.rows.extend(rows)
+        if self.crash_after_append:
+            raise SystemExit("worker killed after append")
+
+    def tail(self, count):
+        return self.rows[-count:]
+
+    def data(self):
+        """Rows without their trailing export id"""
+        return [row[:-1] for row in self.rows]
+
+
+def make_queue(path, sheet, batch_size=20, flush_interval=3600, background=False):
+    queue = WriteBehindQueue(str(path), flush_fn=sheet.append_rows, tail_fn=sheet.tail,
+                             batch_size=batch_size, flush_interval=flush_interval)
+    if not background:
+        # Tests drive flush() themselves; a racing flusher thread would steal batches
+        queue._ensure_started = lambda: None
+    return queue
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return tmp_path / "queue.journal"
+
+
+def test_flush_writes_rows_with_their_ids(journal):
+    sheet = FakeSheet()
+    queue = make_queue(journal, sheet)
+    ids = queue.enqueue_many([["Ann", "1"], ["Bob", "2"]])
+
+    assert queue.flush() == 2
+    assert sheet.rows == [["Ann", "1", ids[0]], ["Bob", "2", ids[1]]]
+    assert queue.pending_count() == 0
+
+
+def test_pending_rows_are_replayed_by_a_new_process(journal):
+    sheet = FakeSheet()
+    make_queue(journal, sheet).enqueue_many([["Ann", "1"], ["Bob", "2"]])
+
+    assert make_queue(journal, sheet).flush() == 2
+    assert sheet.data() == [["Ann", "1"], ["Bob", "2"]]
+
+
+def test_crash_after_append_is_not_written_again_by_another_worker(journal):
+    sheet = FakeSheet()
+    crashed = make_queue(journal, sheet)
+    crashed.enqueue_many([["Ann", "1"], ["Bob", "2"]])
+
+    sheet.crash_after_append = True
+    with pytest.raises(SystemExit):
+        crashed.flush()
+    sheet.crash_after_append = False
+
+    other_worker = make_queue(journal, sheet)
+    assert other_worker.flush() == 0
+    assert other_worker.pending_count() == 0
+    assert sheet.data() == [["Ann", "1"], ["Bob", "2"]]
+
+
+def test_crash_after_partial_batch_only_sends_the_rest(journal):
+    sheet = FakeSheet()
+    queue = make_queue(journal, sheet, batch_size=2)
+    queue.enqueue_many([["Ann", "1"], ["Bob", "2"], ["Cy", "3"]])
+
+    sheet.crash_after_append = True
+    with pytest.raises(SystemExit):
+        queue.flush()
+    sheet.crash_after_append = False
+
+    restarted = make_queue(journal, sheet, batch_size=2)
+    assert restarted.flush() == 0  # the batch that landed is only acknowledged
+    assert restarted.flush() == 1
+    assert sheet.data() == [["Ann", "1"], ["Bob", "2"], ["Cy", "3"]]
+
+
+def test_failed_call_before_append_is_retried(journal):
+    sheet = FakeSheet()
+    queue = make_queue(journal, sheet)
+    queue.enqueue_many([["Ann", "1"]])
+
+    sheet.fail_before_append = True
+    with pytest.raises(ConnectionError):
+        queue.flush()
+    sheet.fail_before_append = False
+
+    assert queue.flush() == 1
+    assert sheet.data() == [["Ann", "1"]]
+
+
+def test_identical_rows_are_all_exported(journal):
+    sheet = FakeSheet()
+    sheet.rows = [["Ann", "1", "older-export"]]
+    queue = make_queue(journal, sheet)
+    queue.enqueue_many([["Ann", "1"], ["Ann", "1"]])
+
+    sheet.fail_before_append = True
+    with pytest.raises(ConnectionError):
+        queue.flush()
+    sheet.fail_before_append = False
+
+    assert queue.flush() == 2
+    assert sheet.data() == [["Ann", "1"]] * 3
+
+
+def test_torn_journal_line_is_skipped(journal):
+    sheet = FakeSheet()
+    queue = make_queue(journal, sheet)
+    queue.enqueue_many([["Ann", "1"]])
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "id": "torn", "ro')
+
+    assert queue.pending_count() == 1
+    assert queue.flush() == 1
+    assert sheet.data() == [["Ann", "1"]]
+
+
+def test_start_replays_rows_left_from_before_a_restart(journal):
+    sheet = FakeSheet()
+    make_queue(journal, sheet).enqueue_many([["Ann", "1"], ["Bob", "2"]])
+
+    restarted = make_queue(journal, sheet, flush_interval=0.01, background=True)
+    restarted.start()
+    deadline = time.time() + 5
+    while len(sheet.rows) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert sheet.data() == [["Ann", "1"], ["Bob", "2"]]
+
+
+def test_enqueue_does_not_reread_the_journal(journal, monkeypatch):
+    sheet = FakeSheet()
+    queue = make_queue(journal, sheet, batch_size=2)
+    queue.enqueue_many([["Ann", "1"]])
+    monkeypatch.setattr(queue, "_read_journal", lambda: pytest.fail("journal read on enqueue"))
+    queue.enqueue_many([["Bob", "2"]])
+    assert queue._wakeup.is_set()
@@ -0,0 +1,218 @@
+import fcntl
+import json
+import os
+import threading
+import uuid
+
+# Trailing sheet column holding each exported row's journal id
+EXPORT_ID_HEADER = "Export ID"
+
+
+class WriteBehindQueue:
+    """
+    Durable write-behind queue for confirmed prescription rows.
+
+    Rows are appended to a local journal (one JSON object per line) and
+    acknowledged immediately. A background thread flushes pending rows in
+    batches through a single bulk call and records an "ack" line once the
+    batch is written, so unacknowledged rows are replayed after a restart.
+    The journal is shared by every worker on the host and guarded by a
+    file lock, so only one process flushes a given batch.
+
+    Each exported row carries its journal id as an extra last cell. A
+    "begin" line is journaled before every bulk call; whichever process
+    later finds a begin without its ack (a crash or a failed call in any
+    worker) first looks those ids up in the sheet tail, so a batch that was
+    written but never acknowledged is not written again.
+    """
+
+    def __init__(self, journal_path, flush_fn, tail_fn=None, batch_size=20,
+                 flush_interval=2.0, max_backoff=60.0):
+        self.journal_path = journal_path
+        self.lock_path = journal_path + ".lock"
+        self.flush_fn = flush_fn
+        self.tail_fn = tail_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._failures = 0
+        # Rows pending as of this process's last flush plus those it queued
+        # since, so a save never has to re-read the journal
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Journal helpers
+    # ------------------------------------------------------------------
+    def _locked(self, blocking=True):
+        lock_file = open(self.lock_path, "a")
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(lock_file, flags)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def _append_journal(self, entries):
+        with open(self.journal_path, "a", encoding="utf-8") as journal:
+            for entry in entries:
+                journal.write(json.dumps(entry) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def _read_pending(self):
+        """Return journal entries that have not been acknowledged yet, in order"""
+        return self._read_journal()[0]
+
+    def _read_journal(self):
+        """
+        Return (pending entries in order, ids of pending entries whose bulk
+        call began but was never acknowledged)
+        """
+        if not os.path.exists(self.journal_path):
+            return [], set()
+
+        pending = {}
+        in_flight = set()
+        with open(self.journal_path, encoding="utf-8") as journal:
+            for line in journal:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn write from a crash; everything before it is intact
+                    print(f"Skipping corrupt journal line: {line[:80]}")
+                    continue
+                if entry.get("op") == "add":
+                    pending[entry["id"]] = entry["row"]
+                elif entry.get("op") == "begin":
+                    in_flight.update(entry.get("ids", []))
+                elif entry.get("op") == "ack":
+                    for entry_id in entry.get("ids", []):
+                        pending.pop(entry_id, None)
+                        in_flight.discard(entry_id)
+
+        return list(pending.items()), in_flight
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def enqueue(self, row):
+        """Durably queue a single row and return its journal id"""
+        return self.enqueue_many([row])[0]
+
+    def enqueue_many(self, rows):
+        """Durably queue several rows in one journal write and return their ids"""
+        entries = [{"op": "add", "id": uuid.uuid4().hex, "row": list(row)} for row in rows]
+
+        lock_file = self._locked()
+        try:
+            self._append_journal(entries)
+        finally:
+            lock_file.close()
+
+        self._ensure_started()
+        with self._pending_lock:
+            self._pending += len(entries)
+            full = self._pending >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+        return [entry["id"] for entry in entries]
+
+    def pending_count(self):
+        return len(self._read_pending())
+
+    def flush(self):
+        """Flush one batch of pending rows. Returns the number of rows written."""
+        lock_file = self._locked(blocking=False)
+        if lock_file is None:
+            # Another worker is flushing right now
+            return 0
+
+        try:
+            pending, in_flight = self._read_journal()
+            with self._pending_lock:
+                self._pending = len(pending)
+            if not pending:
+                self._compact()
+                return 0
+
+            batch = pending[:self.batch_size]
+            if any(entry_id in in_flight for entry_id, _ in batch):
+                # An earlier bulk call may have landed without its ack
+                written = self._already_written([entry_id for entry_id, _ in batch], len(in_flight))
+                if written:
+                    print(f"Skipping {len(written)} queued rows already present in the sheet")
+                    self._append_journal([{"op": "ack", "ids": sorted(written)}])
+                    batch = [(entry_id, row) for entry_id, row in batch if entry_id not in written]
+
+            ids = [entry_id for entry_id, _ in batch]
+            rows = [list(row) + [entry_id] for entry_id, row in batch]
+            if rows:
+                self._append_journal([{"op": "begin", "ids": ids}])
+                self.flush_fn(rows)
+                self._append_journal([{"op": "ack", "ids": ids}])
+            with self._pending_lock:
+                self._pending = max(0, self._pending - len(pending[:self.batch_size]))
+
+            print(f"Flushed {len(rows)} prescriptions to Google Sheets")
+            return len(rows)
+        finally:
+            lock_file.close()
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    def _already_written(self, ids, in_flight_count=0):
+        """
+        Return the ids (from `ids`) found in the last cell of the sheet's
+        final rows. Used when a previous bulk call began but was never
+        acknowledged, so it may have succeeded without its ack being written.
+        """
+        if self.tail_fn is None:
+            return set()
+
+        tail = self.tail_fn(max(len(ids), in_flight_count))
+        exported = {str(row[-1]) for row in tail if row}
+        return {entry_id for entry_id in ids if entry_id in exported}
+
+    def _compact(self):
+        """Truncate the journal once every entry has been acknowledged"""
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > 0:
+            open(self.journal_path, "w").close()
+
+    def _ensure_started(self):
+        # gunicorn forks workers after import, so start one flusher per process
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="sheet-write-behind", daemon=True)
+        self._thread.start()
+
+    def start(self):
+        """
+        Start the background flusher, which first replays whatever the journal
+        still holds from before a restart (also started lazily on enqueue)
+        """
+        self._ensure_started()
+
+    def _run(self):
+        while True:
+            backoff = min(self.max_backoff, self.flush_interval * (2 ** self._failures))
+            self._wakeup.wait(backoff if self._failures else self.flush_interval)
+            self._wakeup.clear()
+            try:
+                while self.flush() >= self.batch_size:
+                    pass
+                self._failures = 0
+            except Exception as e:
+                self._failures += 1
+                print(f"Write-behind flush failed (attempt {self._failures}): {str(e)}")